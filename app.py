@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, g, has_request_context
 import os
 import json
 import pandas as pd
@@ -7,8 +7,23 @@ import uuid
 import time
 from datetime import datetime, timedelta
 from urllib.parse import unquote
-from utils import extract_and_process_tar, allowed_file
+from utils import (extract_and_process_tar, allowed_file, retention_bucket, sort_buckets, get_reference_date,
+                   find_column, find_grid_column, bucket_series, to_epoch_series, replica_capacity, DATE_COLUMNS,
+                   EXPIRY_COLUMNS, BYTE_COLUMNS, RETENTION_COLUMNS, ACTIVE_WINDOW_DAYS,
+                   EXPIRY_WINDOW_DAYS, MAX_WINDOW_DAYS)
 from werkzeug.utils import secure_filename
+import history
+import compare
+import export
+import dataset_cache
+import dataset_snapshot
+import dataset_version
+import watcher
+import indexing
+import warmup
+import forecast
+import shutil
+import tempfile
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'
@@ -17,19 +32,31 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 EXTRACT_FOLDER = os.path.join(BASE_DIR, 'extracted')
 CONFIG_FILE = os.path.join(BASE_DIR, 'config.json')
+HISTORY_DB = os.path.join(BASE_DIR, 'history.db')
+CACHE_FOLDER = os.path.join(BASE_DIR, 'cache')
+SNAPSHOT_FOLDER = os.path.join(BASE_DIR, 'snapshot')
+SCHEMA_FILE = os.path.join(BASE_DIR, 'csv_schemas.json')
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['EXTRACT_FOLDER'] = EXTRACT_FOLDER
 
 # Global storage for the current session data (Simple in-memory store)
 DATA_STORE = {
-    'df': None,
-    'dropped_files': [],
-    'global_stats': None
+    'dataset': None,      # live dataset_version.Dataset, only ever replaced as a whole (publish_dataset)
+    'process_log': []
 }
 
+# Orders publishing of dataset versions
+PUBLISH_LOCK = threading.Lock()
+# Guards restoring the saved dataset snapshot after a restart
+SNAPSHOT_LOCK = threading.Lock()
+STARTUP = {'snapshot_checked': False}
+
+
 # Task storage for background processes
 TASKS = {}
+# Progress bar share of processing an archive, the report warm-up fills the rest
+WARMUP_PERCENT = 90
 
 def background_task(task_id, filepath):
     # Link the live log to the session store so "View Log" can see it immediately
@@ -40,23 +67,78 @@ def background_task(task_id, filepath):
         TASKS[task_id]['percent'] = percent
         TASKS[task_id]['log'].append(f"{datetime.now().strftime('%H:%M:%S')} - {message}")
 
+    def ingest_progress(message, percent):
+        update_progress(message, percent * (WARMUP_PERCENT - 5) // 100)
+
     try:
         TASKS[task_id]['state'] = 'processing'
         TASKS[task_id]['message'] = 'Starting process'
         
-        # Process the file
-        df, dropped_files, error = extract_and_process_tar(filepath, app.config['EXTRACT_FOLDER'], progress_callback=update_progress)
+        # Process the file (or reuse the pre-processed dataset if the watcher already ingested it)
+        cached = dataset_cache.load(CACHE_FOLDER, filepath)
+        if cached is not None:
+            update_progress("Loading pre-processed dataset from cache", WARMUP_PERCENT // 2)
+            df, dropped_files = cached
+            error = None
+        else:
+            df, dropped_files, error = extract_and_process_tar(filepath, app.config['EXTRACT_FOLDER'], progress_callback=ingest_progress,
+                                                               schema_file=SCHEMA_FILE)
         
         if error:
             TASKS[task_id]['state'] = 'failed'
             TASKS[task_id]['error'] = error
             DATA_STORE['process_log'] = TASKS[task_id]['log']
         else:
-            # Store Data
-            DATA_STORE['df'] = df
-            DATA_STORE['dropped_files'] = dropped_files
-            DATA_STORE['global_stats'] = None # Reset cache
+            # Sorted by grid/customer so report views are slices, then index
+            update_progress("Indexing reports and clients...", WARMUP_PERCENT - 4)
+            df = indexing.sort_for_reports(df)
+            report_index = indexing.build_report_indexes(df)
+            time_index = indexing.build_time_index(df)
+            client_index = indexing.build_client_index(df)
+
+            update_progress("Building capacity reclaim forecast...", WARMUP_PERCENT - 3)
+            reclaim = forecast.build_reclaim_forecast(df, get_reference_date(df)[0])
+
+            # New dataset version, not live until its global stats are ready
+            dataset = dataset_version.Dataset(df, filepath, dropped_files=dropped_files, report_index=report_index,
+                                              time_index=time_index, client_index=client_index, reclaim=reclaim,
+                                              menu=build_menu(df))
+
+            if cached is None:
+                # Keep a compact aggregate of this archive for the Trends view
+                try:
+                    update_progress("Saving trend snapshot...", WARMUP_PERCENT - 2)
+                    history.save_snapshot(HISTORY_DB, os.path.basename(filepath), df)
+                except Exception as e:
+                    TASKS[task_id]['log'].append(f"{datetime.now().strftime('%H:%M:%S')} - Trend snapshot failed: {str(e)}")
+                    print(f"Error saving trend snapshot: {e}")
+
+                try:
+                    dataset_cache.save(CACHE_FOLDER, filepath, df, dropped_files)
+                except Exception as e:
+                    print(f"Error caching processed dataset: {e}")
             
+            # The previous dataset keeps serving until the new one can answer
+            # the Global Dashboard, then requests switch over in one step
+            update_progress("Computing global dashboard...", WARMUP_PERCENT - 1)
+            get_report_stats('global', None, dataset=dataset)
+            if publish_dataset(dataset):
+                TASKS[task_id]['filepath'] = filepath
+                TASKS[task_id]['ready'] = True
+                # Grid/customer reports warm up on the live version, any not
+                # warm yet are computed on demand
+                warm_reports(dataset, update_progress)
+            else:
+                TASKS[task_id]['log'].append(f"{datetime.now().strftime('%H:%M:%S')} - A newer dataset was loaded meanwhile, this one was not published.")
+
+            # Lets a restarted service come back with this dataset
+            try:
+                update_progress("Saving dataset snapshot...", 100)
+                save_dataset_snapshot(dataset)
+            except Exception as e:
+                TASKS[task_id]['log'].append(f"{datetime.now().strftime('%H:%M:%S')} - Dataset snapshot failed: {str(e)}")
+                print(f"Error saving dataset snapshot: {e}")
+
             # Save Log
             TASKS[task_id]['percent'] = 100
             TASKS[task_id]['log'].append(f"{datetime.now().strftime('%H:%M:%S')} - Process completed successfully.")
@@ -73,6 +155,257 @@ def background_task(task_id, filepath):
         DATA_STORE['process_log'] = TASKS[task_id]['log']
         print(f"Task {task_id} failed: {e}")
 
+def build_menu(df):
+    """Grid and customer lists for the navigation menu."""
+    grid_col = find_grid_column(df)
+    grids = sorted(df[grid_col].dropna().unique().tolist()) if grid_col else []
+    customers = sorted(df['extracted_customer'].dropna().unique().tolist()) \
+        if 'extracted_customer' in df.columns else []
+    return {'menu_grids': grids, 'menu_customers': customers, 'grid_col': grid_col}
+
+def publish_dataset(dataset):
+    """
+    Makes dataset the live version. Returns False (and leaves the live one)
+    if a dataset loaded later has been published meanwhile.
+    """
+    with PUBLISH_LOCK:
+        live = DATA_STORE['dataset']
+        if live is not None and live.version > dataset.version:
+            return False
+        DATA_STORE['dataset'] = dataset
+    print(f"Dataset version {dataset.version} is live ({dataset.source}, {dataset.rows} rows)")
+    return True
+
+def current_dataset():
+    """
+    The live dataset version, or None. Within a request the version seen
+    first is kept for the whole request (rendering included), so a dataset
+    going live mid-request does not mix into its response.
+    """
+    if not has_request_context():
+        return DATA_STORE['dataset']
+    if 'dataset' not in g:
+        g.dataset = DATA_STORE['dataset']
+    return g.dataset
+
+def save_dataset_snapshot(dataset):
+    if DATA_STORE['dataset'] is not dataset:
+        return
+    state = {
+        'dropped_files': dataset.dropped_files,
+        'menu': dataset.menu,
+        'report_stats': dict(dataset.report_stats),
+        'report_index': dataset.report_index,
+        'time_index': dataset.time_index,
+        'client_index': dataset.client_index,
+        'reclaim': dataset.reclaim
+    }
+    dataset_snapshot.save(SNAPSHOT_FOLDER, dataset.frame(), dataset.source, state)
+
+def restore_snapshot_state():
+    """
+    Publishes the last dataset after a restart from its snapshot state
+    (stats, menu, indexes). The rows themselves are only loaded once a view
+    needs them (Dataset.frame).
+    """
+    if not dataset_snapshot.exists(SNAPSHOT_FOLDER):
+        return
+    try:
+        manifest, state = dataset_snapshot.load_state(SNAPSHOT_FOLDER)
+    except Exception as e:
+        print(f"Error reading dataset snapshot: {e}")
+        return
+
+    def load_rows():
+        # The snapshot folder may hold a newer dataset by now
+        if dataset_snapshot.load_manifest(SNAPSHOT_FOLDER)['created_at'] != manifest['created_at']:
+            raise ValueError("Snapshot was replaced")
+        return dataset_snapshot.load_frame(SNAPSHOT_FOLDER, manifest, state)
+
+    dataset = dataset_version.Dataset(None, manifest['source'], dropped_files=state['dropped_files'],
+                                      report_index=state['report_index'], time_index=state['time_index'],
+                                      client_index=state['client_index'], reclaim=state.get('reclaim'),
+                                      menu=state['menu'], report_stats=state['report_stats'],
+                                      loader=load_rows, rows=manifest['rows'])
+    publish_dataset(dataset)
+    print(f"Restored snapshot state for {manifest['source']} ({manifest['rows']} rows)")
+
+def dataset_available():
+    """True if a dataset is loaded or can be restored from the snapshot."""
+    return current_dataset() is not None
+
+def get_dataset():
+    """The rows of the current dataset version (loaded from the snapshot on first use), or None."""
+    dataset = current_dataset()
+    return dataset.frame() if dataset is not None else None
+
+def warm_reports(dataset, update_progress):
+    """
+    Pre-computes the grid and customer dashboard stats of a published
+    dataset version (nothing if warm-up is turned off).
+    """
+    config = load_config()
+    workers = int(config.get('warmup_workers', 2))
+    if workers <= 0:
+        return
+
+    df = dataset.frame()
+    targets = warmup.warmup_targets(df, config.get('warmup_order', 'largest'))
+
+    def compute(kind, name):
+        get_report_stats(kind, name, dataset=dataset)
+
+    def progress(done, total):
+        # Called per report, only log every 5%
+        step = max(1, total // 20)
+        if done % step == 0 or done == total:
+            update_progress(f"Warming up reports ({done}/{total})",
+                            WARMUP_PERCENT + int(done * (100 - WARMUP_PERCENT) / total))
+
+    started = time.time()
+    update_progress(f"Warming up reports (0/{len(targets)})", WARMUP_PERCENT)
+    # Stop early once a dataset loaded later has gone live
+    done = warmup.run(targets, compute, workers=workers, progress=progress,
+                      is_current=lambda: DATA_STORE['dataset'] is None or DATA_STORE['dataset'].version <= dataset.version)
+    print(f"Warmed {done} reports in {time.time() - started:.1f}s")
+
+def report_subset(df, kind, name, indexes=None):
+    """
+    Rows of df behind a grid or customer report (None if the column is
+    missing). indexes are the report indexes built for df, if any.
+    """
+    index = (indexes or {}).get(kind)
+    if index is not None:
+        rows = index.rows(df, name)
+        return rows if rows is not None else df.iloc[0:0]
+
+    if kind == 'grid':
+        grid_col = find_grid_column(df)
+        return df[df[grid_col] == name] if grid_col else None
+    if 'extracted_customer' in df.columns:
+        return df[df['extracted_customer'] == name]
+    return None
+
+def parse_report_window(args):
+    """
+    Reads the as_of (YYYY-MM-DD), active_days and expiry_days query
+    parameters. Returns (window, error): window is None when all are left at
+    their defaults, error is a message for invalid values (which are ignored).
+    """
+    window = {'as_of': None, 'active_days': ACTIVE_WINDOW_DAYS, 'expiry_days': EXPIRY_WINDOW_DAYS}
+    errors = []
+
+    as_of = args.get('as_of', '').strip()
+    if as_of:
+        try:
+            # End of the day, so backups completed on the as-of date count
+            window['as_of'] = datetime.strptime(as_of, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
+        except ValueError:
+            errors.append(f"Invalid as-of date '{as_of}', expected YYYY-MM-DD.")
+
+    for key in ('active_days', 'expiry_days'):
+        value = args.get(key, '').strip()
+        if not value:
+            continue
+        try:
+            days = int(value)
+            if not 1 <= days <= MAX_WINDOW_DAYS:
+                raise ValueError
+            window[key] = days
+        except ValueError:
+            errors.append(f"Invalid {key.replace('_', ' ')} '{value}', expected 1-{MAX_WINDOW_DAYS}.")
+
+    is_default = window['as_of'] is None and window['active_days'] == ACTIVE_WINDOW_DAYS \
+        and window['expiry_days'] == EXPIRY_WINDOW_DAYS
+    return (None if is_default else window), (' '.join(errors) or None)
+
+def window_query(window):
+    """Query parameters that reproduce a custom window (for links and forms)."""
+    if window is None:
+        return {}
+    args = {}
+    if window['as_of'] is not None:
+        args['as_of'] = window['as_of'].strftime('%Y-%m-%d')
+    if window['active_days'] != ACTIVE_WINDOW_DAYS:
+        args['active_days'] = window['active_days']
+    if window['expiry_days'] != EXPIRY_WINDOW_DAYS:
+        args['expiry_days'] = window['expiry_days']
+    return args
+
+def report_windows(time_index, kind, name, today, active_days, expiry_days):
+    """Positions of the recent/expiring backups of a report view from the TimeIndex, or None."""
+    if time_index is None:
+        return None
+    return time_index.windows(kind, name,
+                              (today - timedelta(days=active_days)).timestamp(),
+                              today.timestamp(),
+                              (today + timedelta(days=expiry_days)).timestamp())
+
+def is_report_name(dataset, kind, name):
+    """True if the dataset version has a grid/customer report of that name."""
+    index = dataset.report_index.get(kind)
+    if index is not None:
+        return name in index
+    key = 'menu_grids' if kind == 'grid' else 'menu_customers'
+    return name in (dataset.menu or {}).get(key, [])
+
+def get_report_stats(kind, name, window=None, dataset=None):
+    """
+    Dashboard stats for the global view ('global', None) or a grid/customer
+    report of a dataset version (the current one by default). Stats for the
+    default windows are cached with the version (for grids and customers
+    it holds), a custom window (see parse_report_window) is computed for
+    the request.
+    """
+    dataset = current_dataset() if dataset is None else dataset
+    if dataset is None:
+        return None
+    cache = dataset.report_stats
+    # Names from arbitrary URLs must not grow the cache
+    cacheable = window is None and (kind == 'global' or is_report_name(dataset, kind, name))
+    if cacheable and (kind, name) in cache:
+        return cache[(kind, name)]
+
+    df = dataset.frame()
+    if df is None:
+        return None
+    subset = df if kind == 'global' else report_subset(df, kind, name, dataset.report_index)
+    if subset is None:
+        return None
+
+    window = window or {'as_of': None, 'active_days': ACTIVE_WINDOW_DAYS, 'expiry_days': EXPIRY_WINDOW_DAYS}
+    today = window['as_of'] or get_reference_date(df)[0]
+    windows = report_windows(dataset.time_index, kind, name, today, window['active_days'], window['expiry_days'])
+    stats = get_dashboard_stats(subset, full_df=df, today=window['as_of'], active_days=window['active_days'],
+                                expiry_days=window['expiry_days'], windows=windows)
+    if cacheable:
+        cache[(kind, name)] = stats
+    return stats
+
+def preingest_archive(filepath):
+    """
+    Processes an archive into the dataset cache (and trend history) without
+    touching the active session. Returns an error message or None.
+    """
+    # Private extraction folder so a concurrent user upload is not clobbered
+    extract_to = tempfile.mkdtemp(prefix='ltremc_preingest_')
+    try:
+        df, dropped_files, error = extract_and_process_tar(filepath, extract_to, schema_file=SCHEMA_FILE)
+    finally:
+        shutil.rmtree(extract_to, ignore_errors=True)
+
+    if error:
+        return error
+
+    # Cached in report order, so loading it later skips the sort
+    df = indexing.sort_for_reports(df)
+    dataset_cache.save(CACHE_FOLDER, filepath, df, dropped_files)
+    try:
+        history.save_snapshot(HISTORY_DB, os.path.basename(filepath), df)
+    except Exception as e:
+        print(f"Error saving trend snapshot: {e}")
+    return None
+
 # Config Management
 def load_config():
     if os.path.exists(CONFIG_FILE):
@@ -81,7 +414,8 @@ def load_config():
                 return json.load(f)
         except:
             pass
-    return {'input_directory': '', 'recents': []}
+    return {'input_directory': '', 'recents': [], 'preingest_enabled': True, 'preingest_window': '20:00-06:00',
+            'warmup_workers': 2, 'warmup_order': 'largest'}
 
 def save_config(config):
     with open(CONFIG_FILE, 'w') as f:
@@ -101,6 +435,26 @@ def update_recents(filepath):
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(EXTRACT_FOLDER, exist_ok=True)
 
+# Background watcher for the configured input directory
+WATCHER = watcher.InputWatcher(load_config, lambda path: dataset_cache.is_cached(CACHE_FOLDER, path), preingest_archive)
+
+@app.before_request
+def start_watcher():
+    # Started on the first request so only the serving process runs it
+    # (not the debug reloader parent or tools importing this module)
+    WATCHER.start()
+
+@app.before_request
+def restore_last_dataset():
+    # Once per process: pick up the dataset that was active before a restart
+    if STARTUP['snapshot_checked']:
+        return
+    with SNAPSHOT_LOCK:
+        if not STARTUP['snapshot_checked']:
+            STARTUP['snapshot_checked'] = True
+            if DATA_STORE['dataset'] is None:
+                restore_snapshot_state()
+
 @app.context_processor
 def inject_menu_items():
     config = load_config()
@@ -108,31 +462,21 @@ def inject_menu_items():
     
     menu_data = dict(menu_grids=[], menu_customers=[], grid_col=None, app_version=version)
 
-    if DATA_STORE['df'] is not None and not DATA_STORE['df'].empty:
-        df = DATA_STORE['df']
-        
-        # Identify Grid Column (Case insensitive search)
-        grid_col = None
-        for col in df.columns:
-            if col.lower() == 'grid':
-                grid_col = col
-                break
-        
-        # Identify Avamar Grid (from column, not file)
-        grids = []
-        if grid_col:
-            grids = sorted(df[grid_col].dropna().unique().tolist())
-        
-        # Identify Customer (Using the extracted column)
-        customers = []
-        if 'extracted_customer' in df.columns:
-            customers = sorted(df['extracted_customer'].dropna().unique().tolist())
-        
-        menu_data.update(dict(menu_grids=grids, menu_customers=customers, grid_col=grid_col))
+    # Built once per dataset (build_menu) rather than on every request
+    dataset = current_dataset()
+    if dataset is not None and dataset.menu:
+        menu_data.update(dataset.menu)
     
     return menu_data
 
-def get_dashboard_stats(df, full_df=None):
+def get_dashboard_stats(df, full_df=None, today=None, active_days=ACTIVE_WINDOW_DAYS,
+                        expiry_days=EXPIRY_WINDOW_DAYS, windows=None):
+    """
+    Stats for a dashboard view. today overrides the reference date (as-of
+    reporting); active_days/expiry_days size the activity and expiry
+    windows. windows, if given, is (recent, expiring): the positions in df
+    of the backups inside those windows, looked up from the TimeIndex.
+    """
     # Identify Grid Column
     grid_col = None
     for col in df.columns:
@@ -150,30 +494,15 @@ def get_dashboard_stats(df, full_df=None):
     expiration_breakdown = {}
     
     # Determine reference "Today" date
-    # Default to actual system time
-    TODAY = datetime.now()
-    is_override = False
-
-    # Check for completed_date column to detect stale data
     # Use full_df if provided for consistent reporting date across subset views
-    date_ref_df = full_df if full_df is not None else df
-    
-    if 'completed_date' in date_ref_df.columns:
-        try:
-             # Check max date
-             max_date_ts = pd.to_datetime(date_ref_df['completed_date'], errors='coerce').max()
-             
-             if pd.notnull(max_date_ts):
-                 max_date = max_date_ts.to_pydatetime()
-                 # If data max date is older than yesterday, use it as reference
-                 if max_date < (datetime.now() - timedelta(days=1)):
-                     TODAY = max_date
-                     is_override = True
-        except Exception as e:
-            print(f"Error determining max date: {e}")
+    if today is not None:
+        TODAY, is_override = today, True
+    else:
+        date_ref_df = full_df if full_df is not None else df
+        TODAY, is_override = get_reference_date(date_ref_df)
 
-    seven_days_ago = TODAY - timedelta(days=7)
-    next_thirty_days = TODAY + timedelta(days=30)
+    seven_days_ago = TODAY - timedelta(days=active_days)
+    next_thirty_days = TODAY + timedelta(days=expiry_days)
     
     seven_days_ago_ts = seven_days_ago.timestamp()
     next_thirty_days_ts = next_thirty_days.timestamp()
@@ -192,21 +521,6 @@ def get_dashboard_stats(df, full_df=None):
     top_expiring_clients_breakdown = {}
     top_expiring_customers_breakdown = {}
 
-    # Define Helper for Bucketing
-    def get_bucket(val):
-        try:
-             # Handle strings like "30 days" or "30"
-             s = str(val).lower().replace('days','').replace('day','').replace('years','').replace('year','').strip()
-             d = float(s)
-             if d <= 9: return "7 days"
-             if d <= 35: return "30 days"
-             if d <= 100: return "90 days"
-             if d <= 400: return "1 year"
-             return "7 years"
-        except:
-             # If conversion fails, return the string itself (or mapped if needed)
-             return str(val) if val else "Unknown"
-
     if 'extracted_customer' in df.columns:
         # Total Customers with backups in this report
         total_customers = df['extracted_customer'].nunique()
@@ -242,34 +556,26 @@ def get_dashboard_stats(df, full_df=None):
                      break
                      
              print(f"DEBUG: Found date column: {date_col}")
-             # Try to convert to timestamp
-             try:
-                # First try numeric (epoch)
-                backup_ts = pd.to_numeric(df[date_col], errors='raise')
-                print("DEBUG: Converted as numeric (epoch)")
-             except:
-                # If that fails, try datetime conversion and convert to epoch
-                try:
-                    # Convert to datetime (handles most string formats)
-                    dt_series = pd.to_datetime(df[date_col], errors='coerce')
-                    print(f"DEBUG: Sample Datetime conversion: {dt_series.head().tolist()}")
-                    # Convert to seconds (timestamp)
-                    backup_ts = dt_series.apply(lambda x: x.timestamp() if pd.notnull(x) else None)
-                    print("DEBUG: Converted via to_datetime")
-                except Exception as e:
-                    print(f"Date conversion failed for {date_col}: {e}")
-                    backup_ts = pd.Series()
+             if windows is not None:
+                 # Positions from the TimeIndex, no per-request date scan
+                 recent_df = df.iloc[windows[0]]
+             else:
+                 # Parsed once at ingest (completed_epoch); parse here for other frames
+                 if 'completed_epoch' in df.columns:
+                     backup_ts = df['completed_epoch']
+                 else:
+                     backup_ts = to_epoch_series(df[date_col])
 
-             # Fill NaNs with 0 to avoid errors in comparison
-             backup_ts = backup_ts.fillna(0)
-             
-             # Debug Values
-             print(f"DEBUG: Threshold (7 Days Ago): {seven_days_ago_ts}")
-             print(f"DEBUG: Max Date in Data: {backup_ts.max()}")
-             
-             # Filter: completed >= 7 days ago
-             recent_mask = (backup_ts >= seven_days_ago_ts)
-             recent_df = df.loc[recent_mask].copy()
+                 # Fill NaNs with 0 to avoid errors in comparison
+                 backup_ts = backup_ts.fillna(0)
+
+                 # Debug Values
+                 print(f"DEBUG: Threshold ({active_days} Days Ago): {seven_days_ago_ts}")
+                 print(f"DEBUG: Max Date in Data: {backup_ts.max()}")
+
+                 # Filter: completed within the activity window (not after today)
+                 recent_mask = (backup_ts >= seven_days_ago_ts) & (backup_ts <= TODAY.timestamp())
+                 recent_df = df.loc[recent_mask]
              recent_customers = recent_df['extracted_customer'].nunique()
              active_customers_list = sorted(recent_df['extracted_customer'].unique().tolist())
              recent_grids = recent_df[grid_col].nunique() if grid_col else 0
@@ -294,10 +600,11 @@ def get_dashboard_stats(df, full_df=None):
                  r_col = 'retention_string'
              
              if r_col:
-                 recent_df['retention_bucket'] = recent_df[r_col].apply(get_bucket)
+                 # Kept as a separate series, recent_df may be a view of the dataset
+                 recent_buckets = recent_df[r_col].apply(retention_bucket)
                  
                  # 1. Activities per retention (Count)
-                 activity_breakdown = recent_df['retention_bucket'].value_counts().to_dict()
+                 activity_breakdown = recent_buckets.value_counts().to_dict()
                  
                  # 2. Scanned Bytes per retention (GB)
                  byte_col = None
@@ -308,7 +615,7 @@ def get_dashboard_stats(df, full_df=None):
                  
                  if byte_col:
                      # Group by bucket, sum bytes, convert to GB
-                     gb_series = recent_df.groupby('retention_bucket')[byte_col].apply(
+                     gb_series = recent_df.groupby(recent_buckets)[byte_col].apply(
                         lambda x: pd.to_numeric(x, errors='coerce').sum()
                      ) / (1024**3)
                      bytes_breakdown = gb_series.round(2).to_dict()
@@ -322,7 +629,7 @@ def get_dashboard_stats(df, full_df=None):
                      policy_col = r_col
 
                  if policy_col:
-                     types_series = recent_df.groupby('retention_bucket')[policy_col].nunique()
+                     types_series = recent_df.groupby(recent_buckets)[policy_col].nunique()
                      retention_types_breakdown = types_series.to_dict()
 
                  # 4. Top 5 Clients & Customers (GB Written)
@@ -430,26 +737,26 @@ def get_dashboard_stats(df, full_df=None):
                  break
              
         if expiry_col:
-             try:
-                expire_ts = pd.to_numeric(df[expiry_col], errors='raise')
-             except:
-                try:
-                    dt_series = pd.to_datetime(df[expiry_col], errors='coerce')
-                    expire_ts = dt_series.apply(lambda x: x.timestamp() if pd.notnull(x) else None)
-                except:
-                    expire_ts = pd.Series()
-             
-             expire_ts = expire_ts.fillna(0)
-             
-             # Expiring in the next 30 days
-             expiring_mask = (expire_ts > TODAY.timestamp()) & (expire_ts <= next_thirty_days_ts)
-             upcoming_expirations = df.loc[expiring_mask].shape[0]
+             if windows is not None:
+                 expiring_df = df.iloc[windows[1]]
+             else:
+                 if 'expiry_epoch' in df.columns:
+                     expire_ts = df['expiry_epoch']
+                 else:
+                     expire_ts = to_epoch_series(df[expiry_col])
+                 expire_ts = expire_ts.fillna(0)
+
+                 # Expiring within the expiry window, of backups completed by today
+                 expiring_mask = (expire_ts > TODAY.timestamp()) & (expire_ts <= next_thirty_days_ts)
+                 if date_col:
+                     expiring_mask &= (backup_ts <= TODAY.timestamp())
+                 expiring_df = df.loc[expiring_mask]
+             upcoming_expirations = len(expiring_df)
              
              if upcoming_expirations > 0:
-                expiring_df = df.loc[expiring_mask].copy()
                 try:
                     if 'retention_days' in expiring_df.columns:
-                         expiration_breakdown = expiring_df['retention_days'].apply(get_bucket).value_counts().to_dict()
+                         expiration_breakdown = expiring_df['retention_days'].apply(retention_bucket).value_counts().to_dict()
                     elif 'retention_string' in expiring_df.columns:
                         expiration_breakdown = expiring_df['retention_string'].fillna('Unknown').value_counts().to_dict()
                     else:
@@ -547,19 +854,41 @@ def get_dashboard_stats(df, full_df=None):
                  # Sort by GB descending
                  summary_df = summary_df.sort_values('total_gb', ascending=False)
                  
-                 inventory_summary = summary_df[['extracted_customer', 'client_count', 'backup_count', 'total_gb']].to_dict('records')
+                 # Primary vs replica split of each row's total
+                 inv_key_col = inv_client_col if inv_mode == 'client' else 'extracted_customer'
+                 inv_capacity = replica_capacity(df, inv_byte_col, inv_key_col)
+                 for cap_col, gb_col in [('primary_bytes', 'primary_gb'), ('replica_bytes', 'replica_gb')]:
+                     summary_df[gb_col] = (summary_df['extracted_customer'].map(inv_capacity[cap_col]).fillna(0) / (1024**3)).round(2)
+
+                 inventory_summary = summary_df[['extracted_customer', 'client_count', 'backup_count', 'total_gb', 'primary_gb', 'replica_gb']].to_dict('records')
              except Exception as e:
                  print(f"Error creating inventory summary: {e}")
 
-    # General Stats
-    # Define desired sort order for buckets
-    desired_order = ['7 days', '30 days', '90 days', '1 year', '7 years']
-    
-    def sort_buckets(keys):
-        # Map known keys to index, unknown keys get 999
-        order_map = {k: i for i, k in enumerate(desired_order)}
-        return sorted(keys, key=lambda k: order_map.get(k, 999))
+    # Primary vs Replica Capacity
+    # Replicas are copies of backups held on another grid, so adding them to
+    # the primary bytes double-counts the data. Only replicas whose primary
+    # copy is not in this dataset count towards unique capacity.
+    capacity_summary = {}
+    capacity_by_grid = []
+    cap_byte_col = find_column(df, BYTE_COLUMNS)
+    if cap_byte_col and grid_col and 'is_replica' in df.columns:
+        try:
+            by_grid = replica_capacity(df, cap_byte_col, grid_col)
+            totals = by_grid.sum()
+            capacity_summary = {k.replace('_bytes', '_gb'): round(totals[k] / (1024**3), 2) for k in by_grid.columns}
+            for grid, row in by_grid.sort_values('unique_bytes', ascending=False).iterrows():
+                capacity_by_grid.append({
+                    'grid': grid,
+                    'primary_gb': round(row['primary_bytes'] / (1024**3), 2),
+                    'replica_gb': round(row['replica_bytes'] / (1024**3), 2),
+                    'matched_gb': round(row['matched_bytes'] / (1024**3), 2),
+                    'orphan_gb': round(row['orphan_bytes'] / (1024**3), 2),
+                    'unique_gb': round(row['unique_bytes'] / (1024**3), 2)
+                })
+        except Exception as e:
+            print(f"Error calculating replica capacity: {e}")
 
+    # General Stats
     # Sort activity_breakdown keys
     sorted_activity_keys = sort_buckets(activity_breakdown.keys())
     sorted_expiration_keys = sort_buckets(expiration_breakdown.keys())
@@ -591,30 +920,139 @@ def get_dashboard_stats(df, full_df=None):
         'top_expiring_clients_breakdown': top_expiring_clients_breakdown,
         'top_expiring_customers_breakdown': top_expiring_customers_breakdown,
         'inventory_summary': inventory_summary,
+        'capacity_summary': capacity_summary,
+        'capacity_by_grid': capacity_by_grid,
         'simulated_date': TODAY.strftime('%Y-%m-%d'),
         # Add column names for debugging in template if needed
         'debug_cols': list(df.columns) if not df.empty else [],
-        'is_override': is_override
+        'is_override': is_override,
+        'active_days': active_days,
+        'expiry_days': expiry_days
     }
     return stats
 
+def get_client_stats(client_df, full_df):
+    """Stats for the single-client drill-down page (client_df is small)."""
+    TODAY, is_override = get_reference_date(full_df)
+
+    grid_col = find_grid_column(client_df)
+    date_col = find_column(client_df, DATE_COLUMNS)
+    expiry_col = find_column(client_df, EXPIRY_COLUMNS)
+    byte_col = find_column(client_df, BYTE_COLUMNS)
+    r_col = find_column(client_df, RETENTION_COLUMNS)
+
+    work = pd.DataFrame(index=client_df.index)
+    work['grid'] = client_df[grid_col].fillna('Unknown').astype(str) if grid_col else 'Unknown'
+    work['bytes'] = pd.to_numeric(client_df[byte_col], errors='coerce').fillna(0) if byte_col else 0.0
+    work['bucket'] = bucket_series(client_df[r_col]).astype(str) if r_col else 'Unknown'
+    work['completed_ts'] = to_epoch_series(client_df[date_col]) if date_col else float('nan')
+    work['expiry_ts'] = to_epoch_series(client_df[expiry_col]) if expiry_col else float('nan')
+    work['is_replica'] = client_df['is_replica'].astype(bool) if 'is_replica' in client_df.columns else False
+
+    work['source_grid'] = client_df['replica_source_grid'].fillna('') \
+        if 'replica_source_grid' in client_df.columns else ''
+
+    last_ts = work['completed_ts'].max()
+    first_ts = work['completed_ts'].min()
+    active_from_ts = (TODAY - timedelta(days=ACTIVE_WINDOW_DAYS)).timestamp()
+
+    def fmt_ts(ts):
+        return pd.to_datetime(ts, unit='s').strftime('%Y-%m-%d %H:%M') if pd.notnull(ts) else 'N/A'
+
+    # Backup history (newest first) and GB written per day
+    history_rows = []
+    ordered = work.sort_values('completed_ts', ascending=False)
+    for idx, row in ordered.head(500).iterrows():
+        history_rows.append({
+            'completed': str(client_df.at[idx, date_col]) if date_col else 'N/A',
+            'grid': row['grid'],
+            'retention': row['bucket'],
+            'gb': round(row['bytes'] / (1024**3), 2),
+            'expiry': str(client_df.at[idx, expiry_col]) if expiry_col else 'N/A',
+            'replica': bool(row['is_replica']),
+            'source_grid': row['source_grid']
+        })
+
+    daily_activity = []
+    dated = work.dropna(subset=['completed_ts'])
+    if not dated.empty:
+        days = pd.to_datetime(dated['completed_ts'], unit='s').dt.strftime('%Y-%m-%d')
+        daily = dated.groupby(days)['bytes'].sum().sort_index() / (1024**3)
+        daily_activity = [{'date': d, 'gb': round(v, 2)} for d, v in daily.items()]
+
+    # Retention mix
+    retention = work.groupby('bucket').agg(count=('bytes', 'size'), total_bytes=('bytes', 'sum'))
+    retention_mix = [{
+        'bucket': b,
+        'count': int(retention.at[b, 'count']),
+        'gb': round(retention.at[b, 'total_bytes'] / (1024**3), 2)
+    } for b in sort_buckets(retention.index.tolist())]
+
+    # Expiry timeline: bytes still to expire, per month
+    expiry_timeline = []
+    future = work[work['expiry_ts'] > TODAY.timestamp()]
+    if not future.empty:
+        months = pd.to_datetime(future['expiry_ts'], unit='s').dt.strftime('%Y-%m')
+        monthly = future.groupby(months)['bytes'].agg(['size', 'sum']).sort_index()
+        expiry_timeline = [{'month': m, 'count': int(r['size']), 'gb': round(r['sum'] / (1024**3), 2)}
+                           for m, r in monthly.iterrows()]
+
+    # Grids the client appears on, primary copies vs replicas
+    placement = work.groupby(['grid', 'is_replica', 'source_grid']).agg(
+        backups=('bytes', 'size'), total_bytes=('bytes', 'sum'), last_ts=('completed_ts', 'max')).reset_index()
+    grids = [{
+        'grid': r.grid,
+        'role': 'Replica' if r.is_replica else 'Primary',
+        'source_grid': r.source_grid,
+        'count': int(r.backups),
+        'gb': round(r.total_bytes / (1024**3), 2),
+        'last_backup': fmt_ts(r.last_ts)
+    } for r in placement.sort_values(['is_replica', 'grid']).itertuples(index=False)]
+
+    customers = sorted(client_df['extracted_customer'].dropna().astype(str).unique().tolist()) \
+        if 'extracted_customer' in client_df.columns else []
+
+    return {
+        'total_records': len(client_df),
+        'total_gb': round(work['bytes'].sum() / (1024**3), 2),
+        'customers': customers,
+        'first_backup': fmt_ts(first_ts),
+        'last_backup': fmt_ts(last_ts),
+        'is_active': bool(pd.notnull(last_ts) and last_ts >= active_from_ts),
+        'history': history_rows,
+        'daily_activity': daily_activity,
+        'retention_mix': retention_mix,
+        'expiry_timeline': expiry_timeline,
+        'grids': grids,
+        'simulated_date': TODAY.strftime('%Y-%m-%d'),
+        'is_override': is_override
+    }
+
 @app.route('/')
 def index():
     # If we have data, go to dashboard, else show upload
-    if DATA_STORE['df'] is not None:
+    if dataset_available():
          return redirect(url_for('dashboard'))
     
     config = load_config()
     file_options = []
+    file_status = {}
     input_dir = config.get('input_directory')
     
     if input_dir and os.path.exists(input_dir) and os.path.isdir(input_dir):
-        try:
-            for f in os.listdir(input_dir):
-                if f.lower().endswith(('.tar.gz', '.tgz', '.tar')):
-                    file_options.append(f)
-        except Exception as e:
-            print(f"Error reading input directory: {e}")
+        # Reuse the watcher's last scan instead of listing the directory per visit
+        listing = WATCHER.listing(input_dir)
+        if listing is not None:
+            file_options, file_status = listing
+        else:
+            try:
+                for f in sorted(os.listdir(input_dir)):
+                    if f.lower().endswith(watcher.ARCHIVE_SUFFIXES):
+                        file_options.append(f)
+                        if dataset_cache.is_cached(CACHE_FOLDER, os.path.join(input_dir, f)):
+                            file_status[f] = 'warm'
+            except Exception as e:
+                print(f"Error reading input directory: {e}")
 
     # Use cookie for recents if available
     cookie_recents = request.cookies.get('recents')
@@ -641,13 +1079,26 @@ def index():
     if recents_list:
         config['recents'] = recents_list
             
-    return render_template('index.html', config=config, file_options=file_options)
+    return render_template('index.html', config=config, file_options=file_options, file_status=file_status)
 
 @app.route('/update_settings', methods=['POST'])
 def update_settings():
     input_directory = request.form.get('input_directory', '').strip()
+    preingest_window = request.form.get('preingest_window', '').strip()
     config = load_config()
     config['input_directory'] = input_directory
+    config['preingest_enabled'] = request.form.get('preingest_enabled') == 'on'
+    try:
+        watcher.parse_window(preingest_window)
+        config['preingest_window'] = preingest_window
+    except ValueError:
+        flash('Invalid pre-ingest window, expected HH:MM-HH:MM. Window not changed.')
+    if request.form.get('warmup_order') in warmup.ORDERS:
+        config['warmup_order'] = request.form.get('warmup_order')
+    try:
+        config['warmup_workers'] = min(16, max(0, int(request.form.get('warmup_workers', 2))))
+    except ValueError:
+        flash('Invalid number of warm-up workers. Setting not changed.')
     save_config(config)
     flash('Settings updated successfully.')
     return redirect(url_for('index'))
@@ -748,61 +1199,216 @@ def task_status(task_id):
 
 @app.route('/dashboard')
 def dashboard():
-    if DATA_STORE['df'] is None:
+    if not dataset_available():
         return redirect(url_for('index'))
     
-    # Check cache for Global Dashboard
-    if DATA_STORE['global_stats'] is None:
-        print("DEBUG: Calculating Global Dashboard Stats (Cache Miss)")
-        DATA_STORE['global_stats'] = get_dashboard_stats(DATA_STORE['df'], full_df=DATA_STORE['df'])
-    else:
-        print("DEBUG: Serving Global Dashboard Stats from Cache")
-        
-    stats = DATA_STORE['global_stats']
-    return render_template('dashboard.html', stats=stats, dropped_files=DATA_STORE['dropped_files'], title="Global Dashboard")
+    window, error = parse_report_window(request.args)
+    if error:
+        flash(error)
+
+    # Served from the per-dataset cache unless a custom window is requested
+    stats = get_report_stats('global', None, window=window)
+    if stats is None:
+        return redirect(url_for('index'))
+    return render_template('dashboard.html', stats=stats, dropped_files=current_dataset().dropped_files, title="Global Dashboard",
+                           export_scope='global', export_name=None, window_args=window_query(window))
 
 @app.route('/grid/<grid_name>')
 def grid_report(grid_name):
-    if DATA_STORE['df'] is None:
+    if not dataset_available():
          return redirect(url_for('index'))
     
-    df = DATA_STORE['df']
-    
-    # Identify Grid Column again
-    grid_col = None
-    for col in df.columns:
-        if col.lower() == 'grid':
-            grid_col = col
-            break
-            
-    if grid_col is None:
+    window, error = parse_report_window(request.args)
+    if error:
+        flash(error)
+
+    stats = get_report_stats('grid', grid_name, window=window)
+    if stats is None:
         flash("Could not identify 'grid' column in the dataset.")
         return redirect(url_for('dashboard'))
 
-    grid_df = df[df[grid_col] == grid_name]
-    stats = get_dashboard_stats(grid_df, full_df=DATA_STORE['df'])
-    return render_template('dashboard.html', stats=stats, dropped_files=[], title=f"Avamar Grid: {grid_name}")
+    return render_template('dashboard.html', stats=stats, dropped_files=[], title=f"Avamar Grid: {grid_name}",
+                           export_scope='grid', export_name=grid_name, window_args=window_query(window))
 
 @app.route('/customer/<path:customer_name>')
 def customer_report(customer_name):
-    if DATA_STORE['df'] is None:
+    if not dataset_available():
          return redirect(url_for('index'))
     
-    df = DATA_STORE['df']
-    
-    if 'extracted_customer' in df.columns:
-        cust_df = df[df['extracted_customer'] == customer_name]
-        stats = get_dashboard_stats(cust_df, full_df=DATA_STORE['df'])
-        return render_template('dashboard.html', stats=stats, dropped_files=[], title=f"Customer Report: {customer_name}")
+    window, error = parse_report_window(request.args)
+    if error:
+        flash(error)
+
+    stats = get_report_stats('customer', customer_name, window=window)
+    if stats is not None:
+        return render_template('dashboard.html', stats=stats, dropped_files=[], title=f"Customer Report: {customer_name}",
+                               export_scope='customer', export_name=customer_name, window_args=window_query(window))
     else:
         flash("Could not identify Customer column.")
         return redirect(url_for('dashboard'))
 
+@app.route('/client/<path:client_name>')
+def client_report(client_name):
+    df = get_dataset()
+    if df is None:
+         return redirect(url_for('index'))
+
+    client_index = current_dataset().client_index
+    if client_index is None:
+        flash("Could not identify Client column.")
+        return redirect(url_for('dashboard'))
+
+    client_df = client_index.rows(df, client_name)
+    if client_df is None:
+        flash(f"Client not found: {client_name}")
+        return redirect(url_for('dashboard'))
+
+    stats = get_client_stats(client_df, full_df=df)
+    return render_template('client.html', stats=stats, client_name=client_name, title=f"Client: {client_name}")
+
+@app.route('/trends')
+def trends():
+    grids, customers = history.list_dimensions(HISTORY_DB)
+    return render_template('trends.html', trend_grids=grids, trend_customers=customers,
+                           selected_grid=request.args.get('grid', ''),
+                           selected_customer=request.args.get('customer', ''),
+                           title="Capacity Trends")
+
+@app.route('/api/trends')
+def api_trends():
+    try:
+        limit = max(1, int(request.args.get('limit', 52)))
+    except ValueError:
+        limit = 52
+    data = history.query_trends(HISTORY_DB,
+                                grid=request.args.get('grid') or None,
+                                customer=request.args.get('customer') or None,
+                                limit=limit)
+    return jsonify(data)
+
+@app.route('/api/reclaim')
+def api_reclaim():
+    dataset = current_dataset()
+    reclaim = dataset.reclaim if dataset is not None else None
+    if reclaim is None:
+        return jsonify({'error': 'No reclaim forecast for the current dataset'}), 404
+
+    scope = request.args.get('scope', 'global')
+    name = request.args.get('name') or None
+    bucket = request.args.get('bucket', 'day')
+    if scope not in ('global', 'grid', 'customer'):
+        return jsonify({'error': 'Unknown forecast scope'}), 400
+    if bucket not in forecast.BUCKETS:
+        return jsonify({'error': 'Unknown forecast bucket'}), 400
+    try:
+        days = int(request.args.get('days', forecast.FORECAST_DAYS))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= forecast.FORECAST_DAYS:
+        return jsonify({'error': f"days must be 1-{forecast.FORECAST_DAYS}"}), 400
+
+    data = reclaim.series(scope, name, horizon=days, bucket=bucket)
+    if data is None:
+        return jsonify({'error': f"Unknown {scope}: {name}"}), 404
+    return jsonify(data)
+
+def _compare_selection():
+    # Default to comparing the two most recent snapshots
+    snapshots = history.list_snapshots(HISTORY_DB)
+    old_id = request.args.get('old', type=int)
+    new_id = request.args.get('new', type=int)
+    if new_id is None and snapshots:
+        new_id = snapshots[0]['id']
+    if old_id is None and len(snapshots) > 1:
+        old_id = snapshots[1]['id']
+    return snapshots, old_id, new_id
+
+@app.route('/compare')
+def compare_view():
+    snapshots, old_id, new_id = _compare_selection()
+    result = None
+    if old_id is not None and new_id is not None:
+        result = compare.compare_snapshots(HISTORY_DB, old_id, new_id)
+        if result is None:
+            flash("Selected snapshot could not be found.")
+
+    # Only the changed clients are listed on the page, the CSV has everything
+    changed_clients = []
+    if result is not None:
+        clients = result['clients']
+        changed_clients = clients[(clients['status'] != '') | (clients['delta_gb'] != 0)].head(500).to_dict('records')
+
+    return render_template('compare.html', snapshots=snapshots, old_id=old_id, new_id=new_id, result=result,
+                           grid_deltas=result['grids'].to_dict('records') if result else [],
+                           customer_deltas=result['customers'].to_dict('records') if result else [],
+                           changed_clients=changed_clients,
+                           title="Archive Comparison")
+
+@app.route('/compare/export/<scope>')
+def compare_export(scope):
+    if scope not in ('grids', 'customers', 'clients'):
+        return jsonify({'error': 'Unknown export scope'}), 404
+
+    _, old_id, new_id = _compare_selection()
+    result = None
+    if old_id is not None and new_id is not None:
+        result = compare.compare_snapshots(HISTORY_DB, old_id, new_id)
+    if result is None:
+        flash("Select two snapshots to compare.")
+        return redirect(url_for('compare_view'))
+
+    filename = f"LTREMC_diff_{scope}_{result['old']['report_date']}_{result['new']['report_date']}.csv"
+    return Response(result[scope].to_csv(index=False), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/export/<scope>')
+def export_records(scope):
+    df = get_dataset()
+    if df is None:
+         return redirect(url_for('index'))
+
+    name = request.args.get('name')
+    status = request.args.get('filter', 'all')
+    fmt = request.args.get('format', 'csv')
+
+    if scope != 'global' and not name:
+        return jsonify({'error': 'A name is required for this export scope'}), 400
+    if fmt not in ('csv', 'xlsx'):
+        return jsonify({'error': 'Unknown export format'}), 400
+    window, error = parse_report_window(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    window = window or {}
+
+    try:
+        dataset = current_dataset()
+        indexes = dict(dataset.report_index, client=dataset.client_index)
+        positions = export.select_rows(df, scope, name=name, status=status, full_df=df, indexes=indexes,
+                                       time_index=dataset.time_index, today=window.get('as_of'),
+                                       active_days=window.get('active_days', ACTIVE_WINDOW_DAYS),
+                                       expiry_days=window.get('expiry_days', EXPIRY_WINDOW_DAYS))
+    except export.ExportError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = secure_filename(export.export_filename(scope, name, status, fmt))
+
+    if fmt == 'xlsx':
+        body = export.iter_xlsx(df, positions)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = export.iter_csv(df, positions)
+        mimetype = 'text/csv'
+
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/reset')
 def reset():
-    DATA_STORE['df'] = None
-    DATA_STORE['dropped_files'] = []
-    DATA_STORE['global_stats'] = None
+    # Requests already running finish on the version they started with
+    with PUBLISH_LOCK:
+        DATA_STORE['dataset'] = None
+    # Don't bring the dataset back on the next restart
+    dataset_snapshot.clear(SNAPSHOT_FOLDER)
     return redirect(url_for('index'))
 
 @app.route('/api/log')
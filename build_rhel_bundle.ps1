@@ -23,6 +23,19 @@ Write-Host "[-] Copying application files..."
 $FilesToCopy = @(
     "app.py",
     "utils.py",
+    "history.py",
+    "compare.py",
+    "export.py",
+    "dataset_cache.py",
+    "dataset_snapshot.py",
+    "dataset_version.py",
+    "watcher.py",
+    "indexing.py",
+    "warmup.py",
+    "csv_schema.py",
+    "forecast.py",
+    "render_reports.py",
+    "load_test.py",
     "install.sh",
     "requirements.rhel8.python36.txt",
     "README.md",
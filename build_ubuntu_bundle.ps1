@@ -22,6 +22,19 @@ Write-Host "[-] Copying application files..."
 $FilesToCopy = @(
     "app.py",
     "utils.py",
+    "history.py",
+    "compare.py",
+    "export.py",
+    "dataset_cache.py",
+    "dataset_snapshot.py",
+    "dataset_version.py",
+    "watcher.py",
+    "indexing.py",
+    "warmup.py",
+    "csv_schema.py",
+    "forecast.py",
+    "render_reports.py",
+    "load_test.py",
     "install_ubuntu.sh",
     "requirements.txt",
     "README.md",
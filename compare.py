@@ -0,0 +1,156 @@
+"""
+Archive-to-archive comparison.
+
+Diffs two stored snapshots using their cached per-client and per grid/customer
+aggregates (see history.py). Every join is a pandas hash merge on the entity
+keys, so comparing archives with millions of backup rows only touches the few
+thousand aggregate rows kept for each snapshot.
+"""
+
+import numpy as np
+import pandas as pd
+import history
+
+GB = 1024**3
+
+CLIENT_COLUMNS = ['customer', 'client', 'grids', 'status', 'backup_count_old', 'backup_count_new',
+                  'backup_count_delta', 'old_gb', 'new_gb', 'delta_gb', 'delta_pct']
+CUSTOMER_COLUMNS = ['customer', 'status', 'client_count_old', 'client_count_new', 'active_clients_old',
+                    'active_clients_new', 'backup_count_old', 'backup_count_new', 'old_gb', 'new_gb',
+                    'delta_gb', 'delta_pct']
+GRID_COLUMNS = ['grid', 'status', 'client_count_old', 'client_count_new', 'backup_count_old',
+                'backup_count_new', 'old_gb', 'new_gb', 'delta_gb', 'delta_pct']
+
+def _status(in_old, in_new, active_old, active_new):
+    return np.select(
+        [~in_old, ~in_new, active_old & ~active_new, ~active_old & active_new],
+        ['new', 'lost', 'went inactive', 'reactivated'],
+        default=''
+    )
+
+def _add_gb_columns(df):
+    df['old_gb'] = (df['total_bytes_old'] / GB).round(2)
+    df['new_gb'] = (df['total_bytes_new'] / GB).round(2)
+    df['delta_gb'] = (df['new_gb'] - df['old_gb']).round(2)
+    # Percentage growth only makes sense when the entity existed before
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.where(df['total_bytes_old'] > 0,
+                       (df['total_bytes_new'] - df['total_bytes_old']) / df['total_bytes_old'] * 100, np.nan)
+    df['delta_pct'] = np.round(pct, 1)
+    return df.drop(columns=['total_bytes_old', 'total_bytes_new'])
+
+def _outer_join(old, new, keys):
+    merged = old.merge(new, on=keys, how='outer', suffixes=('_old', '_new'), indicator=True)
+    in_old = merged['_merge'] != 'right_only'
+    in_new = merged['_merge'] != 'left_only'
+    merged = merged.drop(columns=['_merge'])
+    numeric = [c for c in old.columns
+               if c not in keys and (pd.api.types.is_numeric_dtype(old[c]) or pd.api.types.is_numeric_dtype(new[c]))]
+    fill_cols = [c + suffix for c in numeric for suffix in ('_old', '_new')]
+    merged[fill_cols] = merged[fill_cols].fillna(0)
+    # The outer join turns missing counts into floats, restore them
+    for c in numeric:
+        if pd.api.types.is_integer_dtype(old[c]) or pd.api.types.is_integer_dtype(new[c]):
+            merged[[c + '_old', c + '_new']] = merged[[c + '_old', c + '_new']].astype('int64')
+    return merged, in_old.values, in_new.values
+
+def diff_clients(old_clients, new_clients):
+    # A client can be reported on several grids (replication), so compare on
+    # customer + client and keep the grid list for reference.
+    def per_client(df):
+        return df.groupby(['customer', 'client']).agg(
+            grids=('grid', lambda g: ', '.join(sorted(set(g)))),
+            backup_count=('backup_count', 'sum'),
+            total_bytes=('total_bytes', 'sum'),
+            is_active=('is_active', 'max')
+        ).reset_index()
+
+    merged, in_old, in_new = _outer_join(per_client(old_clients), per_client(new_clients), ['customer', 'client'])
+    merged['grids'] = merged['grids_new'].fillna(merged['grids_old'])
+    merged = merged.drop(columns=['grids_old', 'grids_new'])
+
+    active_old = merged['is_active_old'].astype(bool).values
+    active_new = merged['is_active_new'].astype(bool).values
+    merged['status'] = _status(in_old, in_new, active_old, active_new)
+    merged['backup_count_delta'] = merged['backup_count_new'] - merged['backup_count_old']
+    merged = merged.drop(columns=['is_active_old', 'is_active_new'])
+
+    merged = _add_gb_columns(merged)[CLIENT_COLUMNS]
+    return merged.reindex(merged['delta_gb'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+def diff_customers(old_entities, new_entities, old_clients, new_clients):
+    def per_customer(entities, clients):
+        totals = entities.groupby('customer').agg(
+            backup_count=('backup_count', 'sum'),
+            total_bytes=('total_bytes', 'sum')
+        )
+        # A client on several grids is one client of the customer, so count
+        # distinct clients rather than adding up the per-grid counts
+        clients = clients.assign(active_client=clients['client'].where(clients['is_active'].astype(bool)))
+        counts = clients.groupby('customer').agg(
+            client_count=('client', 'nunique'),
+            active_clients=('active_client', 'nunique')
+        )
+        counts = counts.reindex(totals.index, fill_value=0).astype('int64')
+        return counts.join(totals).reset_index()
+
+    merged, in_old, in_new = _outer_join(per_customer(old_entities, old_clients),
+                                         per_customer(new_entities, new_clients), ['customer'])
+    merged['status'] = _status(in_old, in_new,
+                               (merged['active_clients_old'] > 0).values,
+                               (merged['active_clients_new'] > 0).values)
+    merged = _add_gb_columns(merged)[CUSTOMER_COLUMNS]
+    return merged.reindex(merged['delta_gb'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+def diff_grids(old_entities, new_entities):
+    def per_grid(df):
+        return df.groupby('grid').agg(
+            client_count=('client_count', 'sum'),
+            backup_count=('backup_count', 'sum'),
+            total_bytes=('total_bytes', 'sum')
+        ).reset_index()
+
+    merged, in_old, in_new = _outer_join(per_grid(old_entities), per_grid(new_entities), ['grid'])
+    merged['status'] = np.select([~in_old, ~in_new], ['new', 'lost'], default='')
+    merged = _add_gb_columns(merged)[GRID_COLUMNS]
+    return merged.sort_values('grid').reset_index(drop=True)
+
+def compare_snapshots(db_path, old_id, new_id):
+    """
+    Compares two snapshots. Returns a dict with the snapshot metadata, a
+    summary and the grid, customer and client delta DataFrames.
+    """
+    old_meta = history.get_snapshot(db_path, old_id)
+    new_meta = history.get_snapshot(db_path, new_id)
+    if old_meta is None or new_meta is None:
+        return None
+
+    old_entities = history.load_entities(db_path, old_id)
+    new_entities = history.load_entities(db_path, new_id)
+    old_clients = history.load_clients(db_path, old_id)
+    new_clients = history.load_clients(db_path, new_id)
+
+    grids = diff_grids(old_entities, new_entities)
+    customers = diff_customers(old_entities, new_entities, old_clients, new_clients)
+    clients = diff_clients(old_clients, new_clients)
+
+    summary = {
+        'new_clients': int((clients['status'] == 'new').sum()),
+        'lost_clients': int((clients['status'] == 'lost').sum()),
+        'inactive_clients': int((clients['status'] == 'went inactive').sum()),
+        'new_customers': int((customers['status'] == 'new').sum()),
+        'lost_customers': int((customers['status'] == 'lost').sum()),
+        'inactive_customers': int((customers['status'] == 'went inactive').sum()),
+        'old_gb': round(float(grids['old_gb'].sum()), 2),
+        'new_gb': round(float(grids['new_gb'].sum()), 2),
+    }
+    summary['delta_gb'] = round(summary['new_gb'] - summary['old_gb'], 2)
+
+    return {
+        'old': old_meta,
+        'new': new_meta,
+        'summary': summary,
+        'grids': grids,
+        'customers': customers,
+        'clients': clients
+    }
@@ -0,0 +1,161 @@
+"""
+Header-fingerprint schema registry for the grid CSV exports.
+
+Grids on different Avamar versions export slightly different columns, and
+letting pd.read_csv infer types file by file sometimes yields mixed-type
+object columns (ints in one chunk, strings in the next). The registry keys
+each distinct header line by a fingerprint and stores for it:
+
+    dtypes    explicit read_csv dtype per column ('int64', 'float64',
+              'bool' or 'object' for text)
+    columns   which column fills each role (domain, client, dates, bytes...)
+
+Files whose header is known are parsed with those fixed dtypes instead of
+inference. An unknown header is parsed once with inference, its schema is
+learned and saved to the registry file. If a later file no longer fits (e.g.
+missing values in an int64 column) it is re-read with inference and the
+stored dtypes are widened.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+# Serializes load/merge/save of registry files between concurrent ingests
+_LOCK = threading.Lock()
+
+def fingerprint(path):
+    """Fingerprint of a CSV file's header line."""
+    with open(path, 'rb') as f:
+        header = f.readline()
+    # Same header with or without BOM / Windows line endings
+    header = header.lstrip(b'\xef\xbb\xbf').rstrip(b'\r\n')
+    return hashlib.sha1(header).hexdigest()[:16]
+
+def learn_dtypes(df):
+    """Explicit dtypes for the columns of an inferred DataFrame."""
+    dtypes = {}
+    for col in df.columns:
+        series = df[col]
+        kind = series.dtype.kind
+        if kind == 'b':
+            dtypes[col] = 'bool'
+        elif kind in 'iu':
+            dtypes[col] = 'int64'
+        elif kind == 'f':
+            dtypes[col] = 'float64'
+        else:
+            # Object columns holding only numbers (mixed int/str chunks) read as floats
+            values = series.dropna()
+            numeric = pd.to_numeric(values, errors='coerce')
+            dtypes[col] = 'float64' if len(values) and numeric.notna().all() else 'object'
+    return dtypes
+
+def widen_dtypes(old, new):
+    """Dtypes that fit both files: int/float mixes become float64, anything else text."""
+    dtypes = {}
+    for col, dtype in new.items():
+        prev = old.get(col, dtype)
+        if prev == dtype:
+            dtypes[col] = dtype
+        elif {prev, dtype} <= {'int64', 'float64'}:
+            dtypes[col] = 'float64'
+        else:
+            dtypes[col] = 'object'
+    return dtypes
+
+def apply_dtypes(df, dtypes):
+    """Converts an inferred DataFrame to the given (numeric or bool) dtypes."""
+    for col, dtype in dtypes.items():
+        series = df[col]
+        if str(series.dtype) == dtype:
+            continue
+        if dtype == 'float64':
+            df[col] = pd.to_numeric(series, errors='coerce').astype('float64')
+        else:
+            df[col] = series.astype(dtype)
+    return df
+
+def map_columns(columns, roles):
+    """role -> first matching column (case-insensitive) for each role in roles."""
+    by_lower = {}
+    for col in columns:
+        by_lower.setdefault(str(col).lower(), col)
+    mapping = {}
+    for role, candidates in roles.items():
+        found = next((by_lower[c.lower()] for c in candidates if c.lower() in by_lower), None)
+        if found is not None:
+            mapping[role] = found
+    return mapping
+
+class SchemaRegistry:
+    """
+    Schemas by header fingerprint, persisted as JSON at path (kept in memory
+    only when path is None).
+    """
+    def __init__(self, path=None, roles=None):
+        self.path = path
+        self.roles = roles or {}
+        self.schemas = self._load()
+        self.changed = set()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading CSV schema registry {self.path}: {e}")
+            return {}
+
+    def read_csv(self, path):
+        """Returns (df, schema) for a CSV file, learning its schema if new."""
+        key = fingerprint(path)
+        schema = self.schemas.get(key)
+        if schema is not None:
+            try:
+                return pd.read_csv(path, dtype=schema['dtypes']), schema
+            except (ValueError, TypeError, OverflowError) as e:
+                print(f"DEBUG: {os.path.basename(path)} does not fit its stored CSV schema ({e}), re-learning")
+
+        df = pd.read_csv(path, low_memory=False)
+        dtypes = learn_dtypes(df)
+        if schema is not None:
+            dtypes = widen_dtypes(schema['dtypes'], dtypes)
+        else:
+            print(f"DEBUG: Learned CSV schema {key} ({len(df.columns)} columns) from {os.path.basename(path)}")
+        schema = {
+            'header': [str(c) for c in df.columns],
+            'dtypes': dtypes,
+            'columns': map_columns(df.columns, self.roles),
+            'learned_from': os.path.basename(path),
+            'learned_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        self.schemas[key] = schema
+        self.changed.add(key)
+
+        # Same types as the files parsed with this schema later. Numbers that
+        # become text must keep the text from the file, so parse those again
+        if any(dtypes[col] == 'object' and df[col].dtype.kind in 'biuf' for col in df.columns):
+            return pd.read_csv(path, dtype=dtypes), schema
+        return apply_dtypes(df, dtypes), schema
+
+    def save(self):
+        """Writes newly learned schemas to the registry file."""
+        if not self.path or not self.changed:
+            return
+        with _LOCK:
+            # Keep schemas another ingest saved since we loaded
+            current = self._load()
+            for key in self.changed:
+                current[key] = self.schemas[key]
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(current, f, indent=4, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        self.changed.clear()
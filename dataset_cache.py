@@ -0,0 +1,65 @@
+"""
+Processed-dataset cache.
+
+Keeps the result of extract_and_process_tar for an archive on disk (pickled
+DataFrame + dropped file list), keyed by the archive's path, size and mtime.
+Loading a cached archive skips extraction and CSV parsing entirely.
+"""
+
+import hashlib
+import os
+import pickle
+
+# Bump when extract_and_process_tar changes the columns it produces, so stale
+# entries are re-processed instead of loaded
+CACHE_VERSION = 4
+
+def cache_key(filepath):
+    st = os.stat(filepath)
+    raw = f"{CACHE_VERSION}|{os.path.abspath(filepath)}|{st.st_size}|{int(st.st_mtime)}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def cache_path(cache_dir, filepath):
+    return os.path.join(cache_dir, cache_key(filepath) + '.pkl')
+
+def is_cached(cache_dir, filepath):
+    try:
+        return os.path.exists(cache_path(cache_dir, filepath))
+    except OSError:
+        return False
+
+def load(cache_dir, filepath):
+    """Returns (df, dropped_files) for a cached archive, or None."""
+    try:
+        path = cache_path(cache_dir, filepath)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+        # Touch so pruning keeps recently used entries
+        os.utime(path, None)
+        return entry['df'], entry['dropped_files']
+    except Exception as e:
+        print(f"Error loading cached dataset for {filepath}: {e}")
+        return None
+
+def save(cache_dir, filepath, df, dropped_files, max_entries=10):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, filepath)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'source': os.path.abspath(filepath), 'df': df, 'dropped_files': dropped_files},
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Readers never see a half-written entry
+    os.replace(tmp_path, path)
+    prune(cache_dir, max_entries)
+
+def prune(cache_dir, max_entries):
+    # Drop the least recently used entries beyond max_entries
+    entries = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.pkl')]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[max_entries:]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,151 @@
+"""
+Column-file snapshot of the active dataset.
+
+The loaded DataFrame is written column by column as .npy files so a restarted
+process can bring it back without re-processing the archive:
+
+    manifest.json       row count, column names/kinds and the source archive
+    col_NNN.npy         one file per column. Numeric, bool and datetime
+                        columns are stored as-is; text columns as int32 codes
+    col_NNN_values.npy  the distinct values of a text column
+    <state>_<attr>.npy  the per-row arrays of the report, time and client
+                        indexes and the reclaim forecast matrices
+    state.pkl           small restart state: dropped files, menu lists,
+                        cached report stats and the index objects (without
+                        their arrays)
+
+Loading parses nothing: each column file is opened with mmap_mode='r' and
+copied once into the DataFrame (text columns are decoded from their codes),
+so the whole dataset is back in memory after a single sequential read, with
+no second in-memory copy of the raw file. load_state only reads state.pkl and
+memory-maps the index arrays, so its cost does not grow with the rows and a
+restarted service can serve cached dashboards before the rows are needed at
+all; the first view that needs rows pays for the full load.
+"""
+
+import copy
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 3
+
+# State entries holding index objects whose arrays are kept in .npy files
+ARRAY_STATE = ('report_index', 'time_index', 'client_index', 'reclaim')
+
+class _ArrayFile:
+    # Stands in for an index array inside state.pkl
+    def __init__(self, file):
+        self.file = file
+
+def _split_arrays(obj, snapshot_dir, name):
+    """Copy of obj (or a dict of them) with its array attributes written to .npy files."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return {key: _split_arrays(value, snapshot_dir, f"{name}_{key}") for key, value in obj.items()}
+    obj = copy.copy(obj)
+    for attr, value in vars(obj).items():
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            filename = f"{name}_{attr}.npy"
+            np.save(os.path.join(snapshot_dir, filename), value)
+            setattr(obj, attr, _ArrayFile(filename))
+    return obj
+
+def _join_arrays(obj, snapshot_dir):
+    # Indexes are only read, so their arrays can stay memory-mapped
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return {key: _join_arrays(value, snapshot_dir) for key, value in obj.items()}
+    for attr, value in vars(obj).items():
+        if isinstance(value, _ArrayFile):
+            setattr(obj, attr, np.load(os.path.join(snapshot_dir, value.file), mmap_mode='r'))
+    return obj
+
+def exists(snapshot_dir):
+    return os.path.exists(os.path.join(snapshot_dir, 'manifest.json'))
+
+def save(snapshot_dir, df, source, state):
+    """Writes df plus the restart state dict, replacing any previous snapshot."""
+    tmp_dir = snapshot_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        filename = f"col_{i:03d}.npy"
+        if series.dtype.kind in 'biufM' and not pd.api.types.is_extension_array_dtype(series.dtype):
+            np.save(os.path.join(tmp_dir, filename), series.values)
+            columns.append({'name': col, 'kind': 'array', 'file': filename})
+        else:
+            codes, uniques = pd.factorize(series)
+            np.save(os.path.join(tmp_dir, filename), codes.astype('int32'))
+            values_file = f"col_{i:03d}_values.npy"
+            np.save(os.path.join(tmp_dir, values_file), np.asarray(uniques, dtype=object), allow_pickle=True)
+            columns.append({'name': col, 'kind': 'codes', 'file': filename, 'values': values_file})
+
+    state = dict(state)
+    for key in ARRAY_STATE:
+        if key in state:
+            state[key] = _split_arrays(state[key], tmp_dir, key)
+    with open(os.path.join(tmp_dir, 'state.pkl'), 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Manifest last, a snapshot without one is ignored
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'source': source,
+        'rows': len(df),
+        'columns': columns,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    # Swap directories so a crash never leaves a half-written snapshot behind
+    old_dir = snapshot_dir + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(snapshot_dir):
+        os.rename(snapshot_dir, old_dir)
+    os.rename(tmp_dir, snapshot_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def load_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest.get('version')}")
+    return manifest
+
+def load_state(snapshot_dir):
+    """Returns (manifest, state) without touching the column files."""
+    manifest = load_manifest(snapshot_dir)
+    with open(os.path.join(snapshot_dir, 'state.pkl'), 'rb') as f:
+        state = pickle.load(f)
+    for key in ARRAY_STATE:
+        if key in state:
+            state[key] = _join_arrays(state[key], snapshot_dir)
+    return manifest, state
+
+def load_frame(snapshot_dir, manifest, state):
+    """Rebuilds the full in-memory DataFrame from the column files."""
+    data = {}
+    for column in manifest['columns']:
+        values = np.load(os.path.join(snapshot_dir, column['file']), mmap_mode='r')
+        if column['kind'] == 'codes':
+            # Code -1 (missing) picks the trailing NaN
+            uniques = np.load(os.path.join(snapshot_dir, column['values']), allow_pickle=True)
+            uniques = np.append(uniques, np.nan)
+            values = uniques[values]
+        data[column['name']] = values
+    return pd.DataFrame(data, columns=[c['name'] for c in manifest['columns']])
+
+def clear(snapshot_dir):
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
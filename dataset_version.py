@@ -0,0 +1,67 @@
+"""
+Versioned datasets.
+
+Everything derived from one loaded archive (rows, report/time/client
+indexes, menu, reclaim forecast and the cached report stats) lives in one
+Dataset object with a version number. The app publishes the live version
+with a single reference assignment, so a request that picked up a version
+keeps working on it to the end even if another archive goes live meanwhile,
+and can never mix the rows of one archive with the stats or indexes of
+another. A new version is built completely (rows, indexes and its global
+stats) before it is published; its grid and customer stats are warmed up
+afterwards.
+
+A Dataset is not changed after it is built, with two exceptions that only
+fill in data of the same version: report_stats caches the stats computed
+from its rows, and a version restored from the snapshot after a restart
+loads its rows on first use (frame).
+"""
+
+import itertools
+import threading
+import time
+
+_VERSIONS = itertools.count(1)
+_VERSION_LOCK = threading.Lock()
+
+def next_version():
+    with _VERSION_LOCK:
+        return next(_VERSIONS)
+
+class Dataset:
+    def __init__(self, df, source, dropped_files=None, report_index=None, time_index=None, client_index=None,
+                 reclaim=None, menu=None, report_stats=None, loader=None, rows=None):
+        self.version = next_version()
+        self.source = source                      # archive path
+        self.dropped_files = dropped_files or []
+        self.report_index = report_index or {}    # 'grid' / 'customer' -> indexing.GroupIndex
+        self.time_index = time_index              # indexing.TimeIndex
+        self.client_index = client_index          # indexing.GroupIndex of clients
+        self.reclaim = reclaim                    # forecast.ReclaimForecast
+        self.menu = menu                          # grid/customer lists for the navigation menu
+        # ('global', None) / ('grid' | 'customer', name) -> stats for the default windows
+        self.report_stats = report_stats if report_stats is not None else {}
+        self.rows = len(df) if df is not None else rows
+        self.created_at = time.time()
+
+        self._df = df
+        self._loader = loader                     # returns the rows if df is not loaded yet
+        self._lock = threading.Lock()
+
+    def frame(self):
+        """The rows of this version (loaded on first use if restored), None if they can't be loaded."""
+        if self._df is None and self._loader is not None:
+            with self._lock:
+                if self._df is None and self._loader is not None:
+                    started = time.time()
+                    try:
+                        self._df = self._loader()
+                        print(f"Loaded dataset version {self.version} in {time.time() - started:.2f}s")
+                    except Exception as e:
+                        print(f"Error loading dataset version {self.version}: {e}")
+                    # One attempt only
+                    self._loader = None
+        return self._df
+
+    def is_loaded(self):
+        return self._df is not None
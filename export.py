@@ -0,0 +1,176 @@
+"""
+Streaming export of backup records.
+
+Rows are selected by scope (global, grid, customer or client) and an optional
+status filter, then written out in fixed-size chunks from a generator so a
+multi-million-row export never has to be built fully in memory.
+"""
+
+import os
+import tempfile
+import numpy as np
+from datetime import timedelta
+from utils import (find_column, find_grid_column, to_epoch_series, get_reference_date,
+                   CLIENT_COLUMNS, DATE_COLUMNS, EXPIRY_COLUMNS, EPOCH_COLUMNS, ACTIVE_WINDOW_DAYS, EXPIRY_WINDOW_DAYS)
+
+SCOPES = ('global', 'grid', 'customer', 'client')
+FILTERS = ('all', 'active', 'inactive', 'expiring')
+
+CHUNK_ROWS = 50000
+# Excel's sheet limit is 1,048,576 rows, leave room for the header
+XLSX_SHEET_ROWS = 1000000
+
+class ExportError(ValueError):
+    pass
+
+def select_rows(df, scope, name=None, status='all', full_df=None, indexes=None, time_index=None,
+                today=None, active_days=ACTIVE_WINDOW_DAYS, expiry_days=EXPIRY_WINDOW_DAYS):
+    """
+    Returns the integer positions of the rows in df matching the scope and
+    status filter:
+      active   - backups completed within the activity window (up to today)
+      inactive - backups of clients with no backup within the activity window
+      expiring - backups completed by today expiring within the expiry window
+    The windows count active_days back / expiry_days ahead from today (the
+    dataset's reference date if not given).
+    indexes ({'grid' | 'customer' | 'client': GroupIndex} built for df) are
+    used instead of scanning the scope column, and time_index (the TimeIndex
+    built for df) instead of comparing dates, when available.
+    """
+    if scope not in SCOPES:
+        raise ExportError(f"Unknown export scope: {scope}")
+    if status not in FILTERS:
+        raise ExportError(f"Unknown export filter: {status}")
+
+    positions = _scope_positions(df, scope, name, indexes)
+    if status == 'all':
+        return positions
+
+    TODAY = today or get_reference_date(full_df if full_df is not None else df)[0]
+    active_from_ts = (TODAY - timedelta(days=active_days)).timestamp()
+    expiry_to_ts = (TODAY + timedelta(days=expiry_days)).timestamp()
+
+    windows = None
+    if time_index is not None and scope != 'client':
+        windows = time_index.windows(scope, name, active_from_ts, TODAY.timestamp(), expiry_to_ts, relative=False)
+
+    if status in ('active', 'inactive'):
+        if windows is not None:
+            recent_positions = windows[0]
+        else:
+            date_col = find_column(df, DATE_COLUMNS)
+            if date_col is None:
+                raise ExportError("No 'completed' date column found in the dataset.")
+            completed = _epochs(df, date_col, 'completed_epoch', positions)
+            recent_positions = positions[((completed >= active_from_ts) & (completed <= TODAY.timestamp())).values]
+
+        if status == 'active':
+            return recent_positions
+        client_col = find_column(df, CLIENT_COLUMNS)
+        if client_col is None:
+            raise ExportError("Could not identify Client column.")
+        active_clients = df[client_col].iloc[recent_positions].unique()
+        return positions[~df[client_col].iloc[positions].isin(active_clients).values]
+
+    if windows is not None:
+        return windows[1]
+    expiry_col = find_column(df, EXPIRY_COLUMNS)
+    if expiry_col is None:
+        raise ExportError("No expiry date column found in the dataset.")
+    expire_ts = _epochs(df, expiry_col, 'expiry_epoch', positions)
+    expiring = ((expire_ts > TODAY.timestamp()) & (expire_ts <= expiry_to_ts)).values
+    # Backups completed after today (as-of exports) don't exist yet
+    date_col = find_column(df, DATE_COLUMNS)
+    if date_col is not None:
+        expiring = expiring & (_epochs(df, date_col, 'completed_epoch', positions) <= TODAY.timestamp()).values
+    return positions[expiring]
+
+def _scope_positions(df, scope, name, indexes):
+    # Ascending row positions of the scope, from the GroupIndex if there is one
+    if scope == 'global':
+        return np.arange(len(df))
+    index = (indexes or {}).get(scope)
+    if index is not None:
+        positions = index.positions(name)
+        return positions if positions is not None else np.empty(0, dtype='int64')
+
+    if scope == 'grid':
+        column = find_grid_column(df)
+        if column is None:
+            raise ExportError("Could not identify 'grid' column in the dataset.")
+    elif scope == 'customer':
+        if 'extracted_customer' not in df.columns:
+            raise ExportError("Could not identify Customer column.")
+        column = 'extracted_customer'
+    else:
+        column = find_column(df, CLIENT_COLUMNS)
+        if column is None:
+            raise ExportError("Could not identify Client column.")
+    return np.flatnonzero((df[column] == name).values)
+
+def _epochs(df, column, epoch_column, positions):
+    # Parsed at ingest for processed datasets, parse here otherwise
+    if epoch_column in df.columns:
+        return df[epoch_column].iloc[positions].fillna(0)
+    return to_epoch_series(df[column].iloc[positions]).fillna(0)
+
+def _record_columns(df):
+    # Positions of the columns written out (not the ingest helper columns)
+    return [i for i, c in enumerate(df.columns) if c not in EPOCH_COLUMNS]
+
+def iter_csv(df, positions, chunk_rows=CHUNK_ROWS):
+    """Yields the selected rows as CSV text, one chunk at a time."""
+    columns = _record_columns(df)
+    yield df.iloc[:0, columns].to_csv(index=False)
+    for start in range(0, len(positions), chunk_rows):
+        chunk = df.iloc[positions[start:start + chunk_rows], columns]
+        yield chunk.to_csv(index=False, header=False)
+
+def iter_xlsx(df, positions, chunk_rows=CHUNK_ROWS, read_size=1024 * 1024):
+    """
+    Writes the selected rows to a temporary write-only workbook (rows are
+    flushed to disk as they are appended) and yields the file in blocks.
+    """
+    from openpyxl import Workbook
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        wb = Workbook(write_only=True)
+        columns = _record_columns(df)
+        header = [str(df.columns[i]) for i in columns]
+        ws = None
+        sheet_rows = XLSX_SHEET_ROWS
+
+        for start in range(0, max(len(positions), 1), chunk_rows):
+            chunk = df.iloc[positions[start:start + chunk_rows], columns]
+            # Excel has no NaN, write empty cells instead
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None):
+                if sheet_rows >= XLSX_SHEET_ROWS:
+                    ws = wb.create_sheet(title=f"Backups {len(wb.worksheets) + 1}")
+                    ws.append(header)
+                    sheet_rows = 0
+                ws.append(row)
+                sheet_rows += 1
+
+        if ws is None:
+            wb.create_sheet(title="Backups 1").append(header)
+        wb.save(path)
+
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(read_size)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.unlink(path)
+
+def export_filename(scope, name, status, extension):
+    parts = ['LTREMC', 'export', scope]
+    if name:
+        parts.append(str(name))
+    if status != 'all':
+        parts.append(status)
+    return '_'.join(parts) + '.' + extension
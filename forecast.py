@@ -0,0 +1,115 @@
+"""
+Capacity-reclaim forecast.
+
+Bytes released by expiring backups per day over the next year, for the global
+view and for every grid and customer. The per-day totals are built once at
+ingest with np.bincount over the pre-parsed expiry_epoch column (one pass for
+all grids, one for all customers), so a forecast for any horizon up to
+FORECAST_DAYS, daily or weekly, is a slice of those arrays and never touches
+the backup rows.
+
+Day 0 holds the backups expiring within 24 hours after the report date, so
+the first N days add up to the dashboard's "Expiring Soon (Next N Days)".
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from utils import find_column, find_grid_column, BYTE_COLUMNS
+
+FORECAST_DAYS = 365
+BUCKETS = ('day', 'week')
+
+DAY_SECONDS = 86400
+GB = 1024 ** 3
+
+class ReclaimForecast:
+    def __init__(self, start, days, totals, grid_rows, grid_days, customer_rows, customer_days):
+        self.start = start                  # report date the forecast counts from
+        self.days = days
+        self.totals = totals                # bytes per day, all backups
+        self.grid_rows = grid_rows          # grid -> row of grid_days
+        self.grid_days = grid_days          # (grids, days) bytes per day
+        self.customer_rows = customer_rows
+        self.customer_days = customer_days
+
+    def daily(self, kind, name=None):
+        """Bytes per day for a view (None if unknown)."""
+        if kind == 'global':
+            return self.totals
+        rows, matrix = (self.grid_rows, self.grid_days) if kind == 'grid' \
+            else (self.customer_rows, self.customer_days)
+        row = rows.get(name)
+        return matrix[row] if row is not None else None
+
+    def series(self, kind, name=None, horizon=FORECAST_DAYS, bucket='day'):
+        """
+        The forecast for a view over the next horizon days, per day or per
+        week (starting with the day after the report date). None if the view
+        is unknown.
+        """
+        daily = self.daily(kind, name)
+        if daily is None:
+            return None
+        horizon = min(max(int(horizon), 1), self.days)
+        daily = daily[:horizon]
+
+        step = 7 if bucket == 'week' else 1
+        firsts = np.arange(0, horizon, step)
+        values = np.add.reduceat(daily, firsts)
+        labels = [(self.start + timedelta(days=int(i) + 1)).strftime('%Y-%m-%d') for i in firsts]
+
+        gb = values / GB
+        return {
+            'start': self.start.strftime('%Y-%m-%d'),
+            'horizon': horizon,
+            'bucket': bucket,
+            'labels': labels,
+            'gb': np.round(gb, 2).tolist(),
+            'cumulative_gb': np.round(np.cumsum(gb), 2).tolist(),
+            'total_gb': round(float(gb.sum()), 2)
+        }
+
+def _by_dimension(codes, count, days, day, weights):
+    # One bincount over (value, day) pairs gives every value's daily totals
+    keep = codes >= 0
+    flat = np.bincount(codes[keep] * days + day[keep], weights=weights[keep], minlength=count * days)
+    return flat.reshape(count, days)
+
+def build_reclaim_forecast(df, today, days=FORECAST_DAYS):
+    """
+    Builds the ReclaimForecast for df counting from today (the report
+    date), or None without pre-parsed expiry times or a byte column.
+    """
+    byte_col = find_column(df, BYTE_COLUMNS)
+    if df.empty or byte_col is None or 'expiry_epoch' not in df.columns:
+        return None
+
+    start_ts = today.timestamp()
+    expiry = df['expiry_epoch'].values.astype('float64')
+    # Day d holds expiries in (start + d days, start + d + 1 days]
+    with np.errstate(invalid='ignore'):
+        day = np.ceil((expiry - start_ts) / DAY_SECONDS) - 1
+        valid = (expiry > start_ts) & (day < days)
+    # Same backups as the dashboard's expiring window: none completed after the report date
+    if 'completed_epoch' in df.columns:
+        valid &= ~(df['completed_epoch'].values > start_ts)
+    day = day[valid].astype('int64')
+    weights = pd.to_numeric(df[byte_col], errors='coerce').fillna(0).values.astype('float64')[valid]
+
+    totals = np.bincount(day, weights=weights, minlength=days)
+
+    grid_rows, grid_days = {}, np.zeros((0, days))
+    grid_col = find_grid_column(df)
+    if grid_col is not None:
+        codes, grids = pd.factorize(df[grid_col], sort=True)
+        grid_days = _by_dimension(codes[valid], len(grids), days, day, weights)
+        grid_rows = {grid: i for i, grid in enumerate(grids)}
+
+    customer_rows, customer_days = {}, np.zeros((0, days))
+    if 'extracted_customer' in df.columns:
+        codes, customers = pd.factorize(df['extracted_customer'], sort=True)
+        customer_days = _by_dimension(codes[valid], len(customers), days, day, weights)
+        customer_rows = {customer: i for i, customer in enumerate(customers)}
+
+    return ReclaimForecast(today, days, totals, grid_rows, grid_days, customer_rows, customer_days)
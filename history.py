@@ -0,0 +1,330 @@
+"""
+Historical snapshot store.
+
+Every processed archive is reduced to a compact aggregate (per grid, customer
+and retention bucket) and kept in a local SQLite database, so capacity trends
+across many archives can be queried without reloading any raw data.
+"""
+
+import os
+import sqlite3
+import pandas as pd
+from datetime import datetime, timedelta
+from utils import (find_column, find_grid_column, bucket_series, sort_buckets, to_epoch_series,
+                   get_reference_date, CLIENT_COLUMNS, DATE_COLUMNS, EXPIRY_COLUMNS,
+                   BYTE_COLUMNS, RETENTION_COLUMNS, ACTIVE_WINDOW_DAYS, EXPIRY_WINDOW_DAYS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    archive TEXT NOT NULL,
+    snapshot_ts REAL NOT NULL,
+    report_date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    total_records INTEGER NOT NULL,
+    UNIQUE (archive, snapshot_ts)
+);
+
+CREATE TABLE IF NOT EXISTS snapshot_buckets (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    grid TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    backup_count INTEGER NOT NULL,
+    total_bytes REAL NOT NULL,
+    active_clients INTEGER NOT NULL,
+    expiring_bytes REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS snapshot_entities (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    grid TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    client_count INTEGER NOT NULL,
+    active_clients INTEGER NOT NULL,
+    backup_count INTEGER NOT NULL,
+    total_bytes REAL NOT NULL,
+    expiring_bytes REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS snapshot_clients (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    grid TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    client TEXT NOT NULL,
+    backup_count INTEGER NOT NULL,
+    total_bytes REAL NOT NULL,
+    is_active INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots (snapshot_ts);
+CREATE INDEX IF NOT EXISTS idx_buckets_snapshot ON snapshot_buckets (snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_entities_snapshot ON snapshot_entities (snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_entities_grid ON snapshot_entities (grid, snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_entities_customer ON snapshot_entities (customer, snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_clients_snapshot ON snapshot_clients (snapshot_id);
+"""
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+def build_snapshot(df):
+    """
+    Reduces a processed dataset to its aggregate snapshot.
+    Returns (buckets_df, entities_df, clients_df, snapshot_ts, report_date).
+    """
+    TODAY, _ = get_reference_date(df)
+    active_from_ts = (TODAY - timedelta(days=ACTIVE_WINDOW_DAYS)).timestamp()
+    expiry_to_ts = (TODAY + timedelta(days=EXPIRY_WINDOW_DAYS)).timestamp()
+
+    grid_col = find_grid_column(df)
+    client_col = find_column(df, CLIENT_COLUMNS)
+    date_col = find_column(df, DATE_COLUMNS)
+    expiry_col = find_column(df, EXPIRY_COLUMNS)
+    byte_col = find_column(df, BYTE_COLUMNS)
+    r_col = find_column(df, RETENTION_COLUMNS)
+
+    work = pd.DataFrame(index=df.index)
+    work['grid'] = df[grid_col].fillna('Unknown').astype(str) if grid_col else 'Unknown'
+    if 'extracted_customer' in df.columns:
+        work['customer'] = df['extracted_customer'].fillna('Unknown').astype(str)
+    else:
+        work['customer'] = 'Unknown'
+    work['bucket'] = bucket_series(df[r_col]).astype(str) if r_col else 'Unknown'
+    work['bytes'] = pd.to_numeric(df[byte_col], errors='coerce').fillna(0) if byte_col else 0.0
+
+    client = df[client_col] if client_col else pd.Series(None, index=df.index, dtype=object)
+    work['client'] = client
+
+    if date_col:
+        active = to_epoch_series(df[date_col]).fillna(0) >= active_from_ts
+    else:
+        active = pd.Series(False, index=df.index)
+    work['active'] = active
+    work['active_client'] = client.where(active)
+
+    if expiry_col:
+        expire_ts = to_epoch_series(df[expiry_col]).fillna(0)
+        expiring = (expire_ts > TODAY.timestamp()) & (expire_ts <= expiry_to_ts)
+        work['expiring_bytes'] = work['bytes'].where(expiring, 0)
+    else:
+        work['expiring_bytes'] = 0.0
+
+    buckets_df = work.groupby(['grid', 'customer', 'bucket']).agg(
+        backup_count=('bytes', 'size'),
+        total_bytes=('bytes', 'sum'),
+        active_clients=('active_client', 'nunique'),
+        expiring_bytes=('expiring_bytes', 'sum')
+    ).reset_index()
+
+    entities_df = work.groupby(['grid', 'customer']).agg(
+        client_count=('client', 'nunique'),
+        active_clients=('active_client', 'nunique'),
+        backup_count=('bytes', 'size'),
+        total_bytes=('bytes', 'sum'),
+        expiring_bytes=('expiring_bytes', 'sum')
+    ).reset_index()
+
+    if client_col:
+        client_work = work.dropna(subset=['client']).copy()
+        client_work['client'] = client_work['client'].astype(str)
+        clients_df = client_work.groupby(['grid', 'customer', 'client']).agg(
+            backup_count=('bytes', 'size'),
+            total_bytes=('bytes', 'sum'),
+            is_active=('active', 'any')
+        ).reset_index()
+    else:
+        clients_df = pd.DataFrame(columns=['grid', 'customer', 'client', 'backup_count', 'total_bytes', 'is_active'])
+
+    # Prefer the archive collection time, fall back to the report date
+    snapshot_ts = None
+    if 'collected_at' in df.columns:
+        collected = pd.to_numeric(df['collected_at'], errors='coerce').max()
+        if pd.notnull(collected):
+            snapshot_ts = float(collected)
+    if snapshot_ts is None:
+        snapshot_ts = TODAY.timestamp()
+
+    return buckets_df, entities_df, clients_df, snapshot_ts, TODAY.strftime('%Y-%m-%d')
+
+def save_snapshot(db_path, archive, df):
+    """
+    Stores the aggregate snapshot of df. Re-ingesting the same archive
+    replaces its previous snapshot. Returns the snapshot id.
+    """
+    buckets_df, entities_df, clients_df, snapshot_ts, report_date = build_snapshot(df)
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM snapshots WHERE archive = ? AND snapshot_ts = ?", (archive, snapshot_ts))
+            cur = conn.execute(
+                "INSERT INTO snapshots (archive, snapshot_ts, report_date, created_at, total_records) VALUES (?, ?, ?, ?, ?)",
+                (archive, snapshot_ts, report_date, datetime.now().isoformat(timespec='seconds'), len(df))
+            )
+            snapshot_id = cur.lastrowid
+
+            conn.executemany(
+                "INSERT INTO snapshot_buckets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(snapshot_id, r.grid, r.customer, r.bucket, int(r.backup_count), float(r.total_bytes),
+                  int(r.active_clients), float(r.expiring_bytes)) for r in buckets_df.itertuples(index=False)]
+            )
+            conn.executemany(
+                "INSERT INTO snapshot_entities VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(snapshot_id, r.grid, r.customer, int(r.client_count), int(r.active_clients), int(r.backup_count),
+                  float(r.total_bytes), float(r.expiring_bytes)) for r in entities_df.itertuples(index=False)]
+            )
+            conn.executemany(
+                "INSERT INTO snapshot_clients VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(snapshot_id, r.grid, r.customer, r.client, int(r.backup_count), float(r.total_bytes),
+                  int(bool(r.is_active))) for r in clients_df.itertuples(index=False)]
+            )
+        return snapshot_id
+    finally:
+        conn.close()
+
+def _scope_filter(grid=None, customer=None, alias='e'):
+    clauses = []
+    params = []
+    if grid:
+        clauses.append(f"{alias}.grid = ?")
+        params.append(grid)
+    if customer:
+        clauses.append(f"{alias}.customer = ?")
+        params.append(customer)
+    return (" AND " + " AND ".join(clauses)) if clauses else "", params
+
+def query_trends(db_path, grid=None, customer=None, limit=52):
+    """
+    Returns the last `limit` snapshots (oldest first) for the global scope or
+    a single grid and/or customer, with totals and a per-bucket GB breakdown.
+    """
+    if not os.path.exists(db_path):
+        return {'snapshots': [], 'buckets': []}
+
+    where, params = _scope_filter(grid, customer)
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f"""
+            SELECT s.id, s.archive, s.snapshot_ts, s.report_date,
+                   SUM(e.backup_count) AS backup_count,
+                   SUM(e.total_bytes) AS total_bytes,
+                   SUM(e.expiring_bytes) AS expiring_bytes
+            FROM snapshots s JOIN snapshot_entities e ON e.snapshot_id = s.id
+            WHERE 1 = 1 {where}
+            GROUP BY s.id
+            ORDER BY s.snapshot_ts DESC, s.id DESC
+            LIMIT ?
+        """, params + [int(limit)]).fetchall()
+        rows = list(reversed(rows))
+        ids = [r['id'] for r in rows]
+
+        # Distinct clients of the scope: summing the per grid/customer counts
+        # would count a client once for every grid holding its backups
+        clients = {}
+        if rows:
+            c_where, c_params = _scope_filter(grid, customer, alias='c')
+            for r in conn.execute(f"""
+                SELECT c.snapshot_id, COUNT(DISTINCT c.client) AS client_count,
+                       COUNT(DISTINCT CASE WHEN c.is_active THEN c.client END) AS active_clients
+                FROM snapshot_clients c
+                WHERE c.snapshot_id IN ({','.join('?' * len(ids))}) {c_where}
+                GROUP BY c.snapshot_id
+            """, ids + c_params):
+                clients[r['snapshot_id']] = (r['client_count'], r['active_clients'])
+
+        snapshots = [{
+            'archive': r['archive'],
+            'snapshot_ts': r['snapshot_ts'],
+            'report_date': r['report_date'],
+            'backup_count': r['backup_count'],
+            'total_gb': round(r['total_bytes'] / (1024**3), 2),
+            'client_count': clients.get(r['id'], (0, 0))[0],
+            'active_clients': clients.get(r['id'], (0, 0))[1],
+            'expiring_gb': round(r['expiring_bytes'] / (1024**3), 2)
+        } for r in rows]
+
+        buckets = []
+        if rows:
+            b_where, b_params = _scope_filter(grid, customer, alias='b')
+            bucket_rows = conn.execute(f"""
+                SELECT b.snapshot_id, b.bucket, SUM(b.total_bytes) AS total_bytes
+                FROM snapshot_buckets b
+                WHERE b.snapshot_id IN ({','.join('?' * len(ids))}) {b_where}
+                GROUP BY b.snapshot_id, b.bucket
+            """, ids + b_params).fetchall()
+
+            # Pivot to one GB series per bucket, aligned with the snapshot order
+            position = {sid: i for i, sid in enumerate(ids)}
+            series = {}
+            for r in bucket_rows:
+                values = series.setdefault(r['bucket'], [0] * len(ids))
+                values[position[r['snapshot_id']]] = round(r['total_bytes'] / (1024**3), 2)
+            buckets = [{'bucket': b, 'gb': series[b]} for b in sort_buckets(series.keys())]
+
+        return {'snapshots': snapshots, 'buckets': buckets}
+    finally:
+        conn.close()
+
+def list_dimensions(db_path):
+    """Returns the grids and customers present in any snapshot (for filter menus)."""
+    if not os.path.exists(db_path):
+        return [], []
+    conn = connect(db_path)
+    try:
+        grids = [r[0] for r in conn.execute("SELECT DISTINCT grid FROM snapshot_entities ORDER BY grid")]
+        customers = [r[0] for r in conn.execute("SELECT DISTINCT customer FROM snapshot_entities ORDER BY customer")]
+        return grids, customers
+    finally:
+        conn.close()
+
+def list_snapshots(db_path, limit=None):
+    """Returns the stored snapshots, newest first."""
+    if not os.path.exists(db_path):
+        return []
+    conn = connect(db_path)
+    try:
+        sql = "SELECT id, archive, snapshot_ts, report_date, total_records FROM snapshots ORDER BY snapshot_ts DESC, id DESC"
+        params = []
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [dict(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+def get_snapshot(db_path, snapshot_id):
+    if not os.path.exists(db_path):
+        return None
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT id, archive, snapshot_ts, report_date, total_records FROM snapshots WHERE id = ?",
+                           (snapshot_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def load_clients(db_path, snapshot_id):
+    """Loads the per-client aggregate of a snapshot as a DataFrame."""
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(
+            "SELECT grid, customer, client, backup_count, total_bytes, is_active FROM snapshot_clients WHERE snapshot_id = ?",
+            conn, params=(snapshot_id,))
+    finally:
+        conn.close()
+
+def load_entities(db_path, snapshot_id):
+    """Loads the per grid/customer aggregate of a snapshot as a DataFrame."""
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(
+            "SELECT grid, customer, client_count, active_clients, backup_count, total_bytes, expiring_bytes "
+            "FROM snapshot_entities WHERE snapshot_id = ?",
+            conn, params=(snapshot_id,))
+    finally:
+        conn.close()
@@ -0,0 +1,233 @@
+"""
+Row indexes built once at ingest.
+
+The dataset is stored sorted by grid, then customer (sort_for_reports), so
+every grid's backups are one contiguous block of rows and a grid report is a
+zero-copy df.iloc[start:end] slice. Within each grid the rows are grouped by
+customer, so a customer's backups are a handful of blocks (one per grid).
+
+GroupIndex maps each value of a column to its rows: for the sort column it
+holds (start, end) row ranges directly, for other columns it orders the row
+numbers by value (stable argsort of the factorized column) and maps every
+value to an (start, end) range of that ordering. A lookup is one dict access
+plus a contiguous slice, instead of a full-column scan per request.
+
+Inside each (grid, customer) block the rows are ordered by completion time,
+and TimeIndex keeps a second per-block ordering by expiry time, so "backups
+completed since T" and "backups expiring between T1 and T2" for any view are
+binary searches (np.searchsorted) rather than boolean masks over the rows.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from utils import find_column, find_grid_column, CLIENT_COLUMNS
+
+# Epoch seconds are stored in the low 32 bits of the TimeIndex keys
+EPOCH_BITS = 32
+EPOCH_MAX = (1 << EPOCH_BITS) - 1
+
+class GroupIndex:
+    def __init__(self, column, order, offsets):
+        self.column = column
+        self.order = order        # row positions grouped by value, None if df is sorted by column
+        self.offsets = offsets    # value -> (start, end) into order (or into df if sorted)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, value):
+        return value in self.offsets
+
+    def positions(self, value):
+        """Row positions of the value's rows (None if unknown)."""
+        bounds = self.offsets.get(value)
+        if bounds is None:
+            return None
+        if self.order is None:
+            return np.arange(bounds[0], bounds[1])
+        return self.order[bounds[0]:bounds[1]]
+
+    def rows(self, df, value):
+        bounds = self.offsets.get(value)
+        if bounds is None:
+            return None
+        if self.order is None:
+            # Contiguous block, a view rather than a copy
+            return df.iloc[bounds[0]:bounds[1]]
+        return df.iloc[self.order[bounds[0]:bounds[1]]]
+
+def build_group_index(df, column, is_sorted=False):
+    """Builds the GroupIndex for df[column]. is_sorted means df is already ordered by column."""
+    codes, uniques = pd.factorize(df[column], sort=True)
+    order = None if is_sorted else np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+    # Missing values (code -1) sort first, the rest follow in value order
+    bounds = int((codes < 0).sum()) + np.concatenate(([0], np.cumsum(counts)))
+
+    offsets = {}
+    for i, value in enumerate(uniques):
+        offsets[value] = (int(bounds[i]), int(bounds[i + 1]))
+
+    return GroupIndex(column, order, offsets)
+
+def build_client_index(df):
+    """Builds the client GroupIndex for df, or None if there is no client column."""
+    client_col = find_column(df, CLIENT_COLUMNS)
+    if client_col is None or df.empty:
+        return None
+    return build_group_index(df, client_col)
+
+def epoch_keys(values):
+    """Whole epoch seconds clipped to the key range, unknown dates as 0."""
+    values = np.nan_to_num(np.asarray(values, dtype='float64'), nan=0.0)
+    return np.clip(values, 0, EPOCH_MAX).astype('int64')
+
+def sort_for_reports(df):
+    """
+    Returns df ordered by grid, then customer, then completion time (stable,
+    missing values first), with a fresh RangeIndex. Build the indexes after
+    sorting.
+    """
+    grid_col = find_grid_column(df)
+    if df.empty or grid_col is None:
+        return df
+
+    keys = [pd.factorize(df[grid_col], sort=True)[0]]
+    if 'extracted_customer' in df.columns:
+        keys.insert(0, pd.factorize(df['extracted_customer'], sort=True)[0])
+    if 'completed_epoch' in df.columns:
+        keys.insert(0, epoch_keys(df['completed_epoch']))
+    # lexsort sorts by the last key first
+    order = np.lexsort(keys)
+    if (order[1:] > order[:-1]).all():
+        return df
+    return df.take(order).reset_index(drop=True)
+
+def build_report_indexes(df):
+    """
+    Grid and customer indexes for a df ordered by sort_for_reports, as
+    {'grid': GroupIndex, 'customer': GroupIndex} (missing columns omitted).
+    """
+    indexes = {}
+    if df.empty:
+        return indexes
+    grid_col = find_grid_column(df)
+    if grid_col is not None:
+        indexes['grid'] = build_group_index(df, grid_col, is_sorted=True)
+    if 'extracted_customer' in df.columns:
+        indexes['customer'] = build_group_index(df, 'extracted_customer')
+    return indexes
+
+def _ranges(starts, ends):
+    """Concatenation of np.arange(start, end) for each pair, vectorized."""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype='int64')
+    shifts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return shifts + np.arange(total)
+
+class TimeIndex:
+    """
+    Completion and expiry times per (grid, customer) block of a df ordered by
+    sort_for_reports. Keys are block_id << 32 | epoch seconds, so one sorted
+    int64 array serves every block and a query for many blocks is a single
+    vectorized searchsorted. Positions returned are relative to the view
+    (global, grid or customer) the blocks make up.
+    """
+    def __init__(self, block_starts, completed_keys, expiry_order, expiry_keys, grid_blocks, customer_blocks):
+        self.block_starts = block_starts        # row where each block starts (+ total rows)
+        self.completed_keys = completed_keys    # per row, ascending (rows are in completion order per block)
+        self.expiry_order = expiry_order        # row positions ordered by block, then expiry
+        self.expiry_keys = expiry_keys          # keys of expiry_order, ascending
+        self.grid_blocks = grid_blocks          # grid -> (first block, end block)
+        self.customer_blocks = customer_blocks  # customer -> block ids
+
+    def blocks(self, kind, name=None):
+        """Block ids making up a view, in row order (None if unknown)."""
+        if kind == 'global':
+            return np.arange(len(self.block_starts) - 1)
+        if kind == 'grid':
+            bounds = self.grid_blocks.get(name)
+            return np.arange(bounds[0], bounds[1]) if bounds is not None else None
+        return self.customer_blocks.get(name)
+
+    def _key(self, blocks, ts):
+        return (blocks.astype('int64') << EPOCH_BITS) | min(max(int(ts), 0), EPOCH_MAX)
+
+    def windows(self, kind, name, active_from_ts, today_ts, expiry_until_ts, relative=True):
+        """
+        Returns (recent, expiring): the view-relative positions of the backups
+        completed from active_from_ts up to today_ts, and of those completed
+        by today_ts expiring after it up to expiry_until_ts (row positions in
+        the whole df if not relative). None if the view is unknown.
+        """
+        blocks = self.blocks(kind, name)
+        if blocks is None:
+            return None
+        starts = self.block_starts[blocks]
+        ends = self.block_starts[blocks + 1]
+        # Where each block begins inside the view
+        view_starts = np.concatenate(([0], np.cumsum(ends - starts)[:-1])) if relative else starts
+
+        # Completion order is the row order, so each block's rows completed by
+        # today are a prefix and the recent ones a range ending there
+        lo = np.searchsorted(self.completed_keys, self._key(blocks, math.ceil(active_from_ts)), side='left')
+        done = np.searchsorted(self.completed_keys, self._key(blocks, math.floor(today_ts)), side='right')
+        lo = np.minimum(lo, done)
+        recent = _ranges(lo - starts + view_starts, done - starts + view_starts)
+
+        lo = np.searchsorted(self.expiry_keys, self._key(blocks, math.floor(today_ts)), side='right')
+        hi = np.searchsorted(self.expiry_keys, self._key(blocks, math.floor(expiry_until_ts)), side='right')
+        rows = self.expiry_order[_ranges(lo, hi)]
+        # Backups completed after today (as-of views) don't exist yet
+        keep = rows < np.repeat(done, hi - lo)
+        offsets = np.repeat(view_starts - starts, hi - lo)
+        expiring = np.sort(rows[keep] + offsets[keep])
+        return recent, expiring
+
+def build_time_index(df):
+    """
+    Builds the TimeIndex for a df ordered by sort_for_reports, or None if it
+    has no pre-parsed completion times (utils.add_epoch_columns).
+    """
+    grid_col = find_grid_column(df)
+    if df.empty or grid_col is None or 'completed_epoch' not in df.columns:
+        return None
+
+    grid_codes, grids = pd.factorize(df[grid_col], sort=True)
+    if 'extracted_customer' in df.columns:
+        customer_codes, customers = pd.factorize(df['extracted_customer'], sort=True)
+    else:
+        customer_codes, customers = np.zeros(len(df), dtype='int64'), []
+
+    # A new block starts wherever grid or customer changes
+    change = np.ones(len(df), dtype=bool)
+    change[1:] = (grid_codes[1:] != grid_codes[:-1]) | (customer_codes[1:] != customer_codes[:-1])
+    first_rows = np.flatnonzero(change)
+    block_ids = np.cumsum(change) - 1
+    block_starts = np.append(first_rows, len(df))
+
+    completed_keys = (block_ids << EPOCH_BITS) | epoch_keys(df['completed_epoch'])
+    expiry = epoch_keys(df['expiry_epoch']) if 'expiry_epoch' in df.columns else np.zeros(len(df), dtype='int64')
+    expiry_all = (block_ids << EPOCH_BITS) | expiry
+    expiry_order = np.argsort(expiry_all, kind='stable')
+
+    block_grid = grid_codes[first_rows]
+    grid_blocks = {}
+    for code, grid in enumerate(grids):
+        found = np.flatnonzero(block_grid == code)
+        if len(found):
+            grid_blocks[grid] = (int(found[0]), int(found[-1]) + 1)
+
+    customer_blocks = {}
+    block_customer = customer_codes[first_rows]
+    order = np.argsort(block_customer, kind='stable')
+    bounds = np.searchsorted(block_customer[order], np.arange(len(customers) + 1))
+    for code, customer in enumerate(customers):
+        customer_blocks[customer] = order[bounds[code]:bounds[code + 1]]
+
+    return TimeIndex(block_starts, completed_keys, expiry_order, expiry_all[expiry_order],
+                     grid_blocks, customer_blocks)
@@ -0,0 +1,337 @@
+"""
+HTTP load test.
+
+Builds a synthetic archive, loads it into a local instance and drives the
+dashboard, grid, customer, status and log routes from concurrent users, then
+reports throughput and p50/p95/p99 latency per route.
+
+Usage:
+    python load_test.py [--users 8] [--duration 30] [--rows 200000]
+                        [--url http://127.0.0.1:9002] [--json results.json]
+                        [--max-p95 MS] [--max-error-rate PCT]
+
+Without --url a private instance is started from a temporary copy of the
+application, under gunicorn with the installed settings (1 worker, 8
+threads) or Flask's threaded server if gunicorn is missing, so the run
+does not touch the local history, cache, snapshot or config. With --url the
+synthetic archive is loaded into that instance, replacing its dataset.
+
+Exits with 1 if a --max-p95 / --max-error-rate threshold is exceeded (and 2
+if the archive could not be loaded), for scripted regression runs.
+"""
+
+import argparse
+import html
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTES = ('dashboard', 'grid', 'customer', 'status', 'log')
+RETENTIONS = [7, 30, 90, 365, 2555]
+
+def build_archive(path, rows, grids, customers, clients_per_customer=20, replica_share=0.15, seed=1):
+    """
+    Writes a synthetic archive (one CSV per grid, same columns as the grid
+    exports) and returns (grid names, customer names).
+    """
+    rng = np.random.RandomState(seed)
+    now = datetime.now().replace(microsecond=0)
+    grid_names = [f"loadgrid{i:02d}" for i in range(grids)]
+    customer_names = [f"loadcust{i:03d}" for i in range(customers)]
+
+    build_dir = tempfile.mkdtemp(prefix='ltremc_loadtest_build_')
+    try:
+        with tarfile.open(path, 'w:gz') as tar:
+            for g, grid in enumerate(grid_names):
+                n = rows // grids + (1 if g < rows % grids else 0)
+                customer = rng.randint(0, customers, n)
+                client = rng.randint(0, clients_per_customer, n)
+                completed = now - pd.to_timedelta(rng.randint(0, 60 * 86400, n), unit='s')
+                retention = np.array(RETENTIONS)[rng.randint(0, len(RETENTIONS), n)]
+                expiry = completed + pd.to_timedelta(retention, unit='D')
+
+                domains = np.array([f"/{c}/clients" for c in customer_names], dtype=object)[customer]
+                if grids > 1:
+                    replica = rng.rand(n) < replica_share
+                    sources = [x for x in grid_names if x != grid]
+                    source = np.array(sources, dtype=object)[rng.randint(0, len(sources), n)]
+                    domains[replica] = ('/REPLICATE/' + source[replica] + domains[replica])
+
+                df = pd.DataFrame({
+                    'grid': grid,
+                    'domain': domains,
+                    'client_name': [f"{customer_names[c]}-host{h:03d}.example.com" for c, h in zip(customer, client)],
+                    'completed_date': completed.strftime('%Y-%m-%d %H:%M:%S'),
+                    'expiry_date': expiry.strftime('%Y-%m-%d %H:%M:%S'),
+                    'retention_days': retention,
+                    'scanned_bytes': rng.randint(10 ** 6, 10 ** 9, n).astype('int64') * 100,
+                    'collected_at': int(time.mktime(now.timetuple()))
+                })
+                csv_path = os.path.join(build_dir, grid + '.csv')
+                df.to_csv(csv_path, index=False)
+                tar.add(csv_path, arcname='grids/' + grid + '.csv')
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    return grid_names, customer_names
+
+def _free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def start_instance(workdir):
+    """Starts the app from a copy in workdir; returns (process, base url, log path)."""
+    app_copy = os.path.join(workdir, 'app')
+    os.makedirs(app_copy)
+    for name in os.listdir(APP_DIR):
+        if name.endswith('.py'):
+            shutil.copy2(os.path.join(APP_DIR, name), app_copy)
+    for name in ('templates', 'static'):
+        shutil.copytree(os.path.join(APP_DIR, name), os.path.join(app_copy, name))
+
+    port = _free_port()
+    try:
+        import gunicorn  # noqa: F401
+        cmd = [sys.executable, '-m', 'gunicorn', '--workers', '1', '--threads', '8', '--timeout', '0',
+               '--bind', f'127.0.0.1:{port}', 'app:app']
+    except ImportError:
+        cmd = [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+    log_path = os.path.join(workdir, 'server.log')
+    log = open(log_path, 'w')
+    process = subprocess.Popen(cmd, cwd=app_copy, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    url = f'http://127.0.0.1:{port}'
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited early, see {log_path}")
+        try:
+            urllib.request.urlopen(url + '/', timeout=2).read()
+            return process, url, log_path
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Server did not start within 60s, see {log_path}")
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def load_archive(url, archive, wait_for='completed', timeout=1800):
+    """Loads the archive through /load_local and waits for it; returns the task id."""
+    data = urllib.parse.urlencode({'filepath': archive}).encode()
+    opener = urllib.request.build_opener(_NoRedirect)
+    try:
+        opener.open(url + '/load_local', data=data, timeout=30)
+        raise RuntimeError("Archive was not accepted by /load_local")
+    except urllib.error.HTTPError as e:
+        location = e.headers.get('Location', '')
+        if e.code not in (301, 302, 303) or '/processing/' not in location:
+            raise RuntimeError(f"Archive was not accepted by /load_local (HTTP {e.code})")
+    task_id = location.rsplit('/', 1)[1]
+
+    started = time.time()
+    while time.time() - started < timeout:
+        status = json.loads(urllib.request.urlopen(f'{url}/status/{task_id}', timeout=30).read().decode())
+        if status.get('state') == 'failed':
+            raise RuntimeError(f"Processing failed: {status.get('error')}")
+        if status.get('state') == 'completed' or (wait_for == 'ready' and status.get('ready')):
+            print(f"Archive loaded in {time.time() - started:.1f}s ({status.get('message')})")
+            return task_id
+        time.sleep(0.5)
+    raise RuntimeError(f"Archive not loaded within {timeout}s")
+
+def report_paths(url):
+    """
+    (grid paths, customer paths) of the reports in the navigation menu of
+    the loaded dataset, as the app links them.
+    """
+    page = urllib.request.urlopen(url + '/dashboard', timeout=120).read().decode('utf-8', 'replace')
+    found = {kind: sorted(set(html.unescape(p) for p in re.findall(rf'href="(/{kind}/[^"]+)"', page)))
+             for kind in ('grid', 'customer')}
+    return found['grid'], found['customer']
+
+def run_load(url, paths, users, duration, timeout=120, seed=1):
+    """
+    Closed-loop load: each user requests a random route, waits for the
+    response and repeats until duration seconds have passed.
+    Returns (samples, elapsed) with samples as (route, seconds, ok) tuples.
+    """
+    samples = []
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def user(n):
+        rng = random.Random(seed + n)
+        local = []
+        while time.time() < stop_at:
+            route = rng.choice(ROUTES)
+            path = rng.choice(paths[route])
+            started = time.time()
+            try:
+                with urllib.request.urlopen(url + path, timeout=timeout) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            local.append((route, time.time() - started, ok))
+        with lock:
+            samples.extend(local)
+
+    started = time.time()
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.time() - started
+
+def _percentile(ordered, pct):
+    # Nearest-rank percentile of an ascending list
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def summarize(samples, elapsed):
+    """Per-route (and overall) request counts, throughput and latency percentiles in ms."""
+    results = {}
+    for route in ROUTES + ('all',):
+        picked = [s for s in samples if route == 'all' or s[0] == route]
+        latencies = sorted(s[1] * 1000 for s in picked)
+        errors = sum(1 for s in picked if not s[2])
+        results[route] = {
+            'requests': len(picked),
+            'errors': errors,
+            'error_rate': round(100.0 * errors / len(picked), 2) if picked else 0.0,
+            'rps': round(len(picked) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(_percentile(latencies, 50), 1),
+            'p95_ms': round(_percentile(latencies, 95), 1),
+            'p99_ms': round(_percentile(latencies, 99), 1),
+            'max_ms': round(latencies[-1], 1) if latencies else 0.0
+        }
+    return results
+
+def print_report(results, elapsed, users):
+    print(f"\n{users} users for {elapsed:.1f}s")
+    print(f"{'Route':<10} {'Requests':>9} {'Errors':>7} {'Req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Max ms':>9}")
+    for route, r in results.items():
+        print(f"{route:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.2f} {r['p50_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the LTREMC Reporter routes with a synthetic archive.")
+    parser.add_argument('--url', help="Base URL of a running instance (default: start a private one)")
+    parser.add_argument('-u', '--users', type=int, default=8, help="Concurrent users")
+    parser.add_argument('-d', '--duration', type=float, default=30, help="Seconds of load")
+    parser.add_argument('--rows', type=int, default=200000, help="Backups in the synthetic archive")
+    parser.add_argument('--grids', type=int, default=4, help="Grids in the synthetic archive")
+    parser.add_argument('--customers', type=int, default=25, help="Customers in the synthetic archive")
+    parser.add_argument('--archive', help="Use this archive instead of a synthetic one (grid/customer routes use its grids and customers)")
+    parser.add_argument('--wait-for', choices=('completed', 'ready'), default='completed',
+                        help="Start the load once processing completed (default) or as soon as the dashboard is ready, i.e. during report warm-up")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--max-p95', type=float, help="Fail if the overall p95 latency exceeds this many ms")
+    parser.add_argument('--max-error-rate', type=float, help="Fail if more than this percent of requests fail")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='ltremc_loadtest_')
+    process = None
+    try:
+        if args.archive:
+            archive = os.path.abspath(args.archive)
+            grid_names = customer_names = None
+        else:
+            archive = os.path.join(workdir, 'synthetic.tar.gz')
+            started = time.time()
+            grid_names, customer_names = build_archive(archive, args.rows, args.grids, args.customers, seed=args.seed)
+            print(f"Built synthetic archive: {args.rows} backups, {args.grids} grids, "
+                  f"{args.customers} customers ({time.time() - started:.1f}s)")
+
+        url = args.url.rstrip('/') if args.url else None
+        if url is None:
+            process, url, log_path = start_instance(workdir)
+            print(f"Started instance at {url} (log: {log_path})")
+
+        try:
+            task_id = load_archive(url, archive, wait_for=args.wait_for)
+        except (RuntimeError, urllib.error.URLError, OSError) as e:
+            print(f"Error loading archive: {e}")
+            return 2
+
+        if grid_names is None:
+            # Names of a real archive come from the loaded instance's menu
+            try:
+                grid_paths, customer_paths = report_paths(url)
+            except (urllib.error.URLError, OSError) as e:
+                print(f"Error reading the report menu: {e}")
+                return 2
+            if not grid_paths or not customer_paths:
+                print("Error: no grid or customer reports found in the loaded archive")
+                return 2
+            print(f"Testing {len(grid_paths)} grid and {len(customer_paths)} customer reports from the archive")
+        else:
+            quote = urllib.parse.quote
+            grid_paths = [f"/grid/{quote(name)}" for name in grid_names]
+            customer_paths = [f"/customer/{quote(name)}" for name in customer_names]
+
+        paths = {
+            'dashboard': ['/dashboard'],
+            'grid': grid_paths,
+            'customer': customer_paths,
+            'status': [f"/status/{task_id}"],
+            'log': ['/api/log']
+        }
+        samples, elapsed = run_load(url, paths, args.users, args.duration, seed=args.seed)
+        results = summarize(samples, elapsed)
+        print_report(results, elapsed, args.users)
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'users': args.users, 'duration': round(elapsed, 2), 'rows': args.rows,
+                           'grids': args.grids, 'customers': args.customers, 'routes': results}, f, indent=4)
+
+        failed = []
+        overall = results['all']
+        if args.max_p95 is not None and overall['p95_ms'] > args.max_p95:
+            failed.append(f"p95 {overall['p95_ms']}ms > {args.max_p95}ms")
+        if args.max_error_rate is not None and overall['error_rate'] > args.max_error_rate:
+            failed.append(f"error rate {overall['error_rate']}% > {args.max_error_rate}%")
+        if failed:
+            print("FAILED: " + ", ".join(failed))
+            return 1
+        return 0
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
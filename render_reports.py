@@ -0,0 +1,221 @@
+"""
+Batch report renderer.
+
+Ingests an archive once and pre-renders the dashboard for the global view,
+every Avamar grid and every customer as static HTML + JSON.
+
+Usage:
+    python render_reports.py <archive.tar.gz> --output <dir> [--workers N]
+
+Rendering is spread over a process pool. Workers share the ingested dataset
+rather than reloading it: with the 'fork' start method (Linux) they inherit it
+copy-on-write, otherwise it is sent once per worker through the initializer.
+
+Links between the reports (menus, grid and customer tables) point at the
+rendered files, so the output can be browsed without the web app. Pages that
+only exist in the app (Trends, Compare, client pages, exports) are not linked.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from markupsafe import escape
+from werkzeug.utils import secure_filename
+from utils import extract_and_process_tar, find_grid_column
+import indexing
+
+# Shares the CSV schemas learned by the web app
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csv_schemas.json')
+
+# Dataset shared by the pool workers (see module docstring)
+_DATASET = None
+_DROPPED_FILES = []
+# (kind, name) -> report file relative to the output directory
+_PAGES = {}
+# App URL (as written in the HTML) -> report file, built per worker
+_LINKS = {}
+
+HREF_RE = re.compile(r'href="(/[^"]*)"')
+
+def assign_pages(grids, customers):
+    """
+    Report file of every view. Names that map to the same file name
+    (secure_filename, case-insensitive file systems) get a numbered suffix.
+    """
+    pages = {('global', None): 'global.html'}
+    for kind, folder, names in (('grid', 'grids', grids), ('customer', 'customers', customers)):
+        taken = {}
+        for name in names:
+            base = secure_filename(str(name)) or 'unnamed'
+            count = taken.get(base.lower(), 0) + 1
+            taken[base.lower()] = count
+            if count > 1:
+                print(f"Warning: {kind} '{name}' has the same file name as another {kind}, "
+                      f"saved as {base}-{count}.html")
+                base = f"{base}-{count}"
+            pages[(kind, name)] = f"{folder}/{base}.html"
+    return pages
+
+def _init_worker(df=None, dropped_files=None, pages=None):
+    global _DATASET, _DROPPED_FILES, _PAGES, _LINKS
+    if df is not None:
+        _DATASET = df
+        _DROPPED_FILES = dropped_files or []
+        _PAGES = pages or {}
+
+    import app as webapp
+    import dataset_version
+    # The navigation menus are built from the live dataset
+    webapp.publish_dataset(dataset_version.Dataset(_DATASET, None, dropped_files=_DROPPED_FILES,
+                                                   report_index=indexing.build_report_indexes(_DATASET),
+                                                   menu=webapp.build_menu(_DATASET)))
+
+    # The exact URLs url_for writes into the templates (HTML-escaped)
+    endpoints = {'global': 'dashboard', 'grid': 'grid_report', 'customer': 'customer_report'}
+    args = {'global': None, 'grid': 'grid_name', 'customer': 'customer_name'}
+    with webapp.app.test_request_context('/'):
+        _LINKS = {'/': _PAGES[('global', None)]}
+        for (kind, name), rel_path in _PAGES.items():
+            url = webapp.url_for(endpoints[kind], **({args[kind]: name} if args[kind] else {}))
+            _LINKS[str(escape(url))] = rel_path
+
+def _json_default(obj):
+    # numpy scalars / timestamps coming out of the stats dict
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
+
+def _relative_links(html, depth):
+    """Points static files and report links at the output directory, drops other app links."""
+    prefix = '../' * depth
+
+    def link(match):
+        target = _LINKS.get(match.group(1))
+        return 'href="' + (prefix + target if target else '#') + '"'
+
+    html = html.replace('"/static/', '"' + prefix + 'static/')
+    return HREF_RE.sub(link, html)
+
+def render_one(kind, name, output_dir):
+    """Renders a single report and returns its relative HTML path."""
+    import app as webapp
+    df = _DATASET
+
+    if kind == 'global':
+        subset = df
+        title = "Global Dashboard"
+        dropped_files = _DROPPED_FILES
+        path = '/dashboard'
+    elif kind == 'grid':
+        subset = webapp.report_subset(df, 'grid', name, webapp.DATA_STORE['dataset'].report_index)
+        title = f"Avamar Grid: {name}"
+        dropped_files = []
+        path = f'/grid/{name}'
+    else:
+        subset = webapp.report_subset(df, 'customer', name, webapp.DATA_STORE['dataset'].report_index)
+        title = f"Customer Report: {name}"
+        dropped_files = []
+        path = f'/customer/{name}'
+
+    stats = webapp.get_dashboard_stats(subset, full_df=df)
+
+    with webapp.app.test_request_context(path):
+        html = webapp.render_template('dashboard.html', stats=stats, dropped_files=dropped_files, title=title)
+
+    rel_path = _PAGES[(kind, name)]
+    html_path = os.path.join(output_dir, rel_path)
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(_relative_links(html, rel_path.count('/')))
+    with open(html_path[:-len('.html')] + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'title': title, 'stats': stats}, f, default=_json_default)
+
+    return rel_path
+
+def _render_task(task):
+    kind, name, output_dir = task
+    return kind, name, render_one(kind, name, output_dir)
+
+def main(argv=None):
+    global _DATASET, _DROPPED_FILES, _PAGES
+
+    parser = argparse.ArgumentParser(description="Pre-render LTREMC dashboards for every grid and customer.")
+    parser.add_argument('archive', help="Path to the .tar.gz/.tgz/.tar archive")
+    parser.add_argument('-o', '--output', default='reports', help="Output directory (default: reports)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+
+    def progress(message, percent):
+        print(f"[{percent:3d}%] {message}")
+
+    extract_dir = tempfile.mkdtemp(prefix='ltremc_extract_')
+    try:
+        df, dropped_files, error = extract_and_process_tar(args.archive, extract_dir, progress_callback=progress,
+                                                           schema_file=SCHEMA_FILE)
+    finally:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+
+    if error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+    # Report order lets each worker slice its grids instead of scanning
+    df = indexing.sort_for_reports(df)
+
+    output_dir = os.path.abspath(args.output)
+    for sub in ('grids', 'customers'):
+        os.makedirs(os.path.join(output_dir, sub), exist_ok=True)
+
+    static_src = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    static_dst = os.path.join(output_dir, 'static')
+    if os.path.isdir(static_src) and not os.path.exists(static_dst):
+        shutil.copytree(static_src, static_dst)
+
+    grid_col = find_grid_column(df)
+    grids = sorted(df[grid_col].dropna().unique().tolist()) if grid_col else []
+    customers = sorted(df['extracted_customer'].dropna().unique().tolist()) if 'extracted_customer' in df.columns else []
+
+    tasks = [('global', None, output_dir)]
+    tasks += [('grid', g, output_dir) for g in grids]
+    tasks += [('customer', c, output_dir) for c in customers]
+    print(f"Rendering {len(tasks)} reports ({len(grids)} grids, {len(customers)} customers) with {args.workers} workers")
+
+    # Make the dataset available before the pool starts so forked workers inherit it
+    _DATASET = df
+    _DROPPED_FILES = dropped_files
+    _PAGES = assign_pages(grids, customers)
+    initargs = () if multiprocessing.get_start_method() == 'fork' else (df, dropped_files, _PAGES)
+
+    manifest = {'archive': os.path.abspath(args.archive), 'global': None, 'grids': {}, 'customers': {}}
+    pool = multiprocessing.Pool(processes=args.workers, initializer=_init_worker, initargs=initargs)
+    try:
+        chunksize = max(1, len(tasks) // (args.workers * 4))
+        for i, (kind, name, rel_path) in enumerate(pool.imap_unordered(_render_task, tasks, chunksize=chunksize), 1):
+            if kind == 'global':
+                manifest['global'] = rel_path
+            else:
+                manifest[kind + 's'][name] = rel_path
+            if i % 50 == 0 or i == len(tasks):
+                print(f"  {i}/{len(tasks)} rendered")
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    with open(os.path.join(output_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+    print(f"Done in {time.time() - started:.1f}s. Output: {output_dir}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,21 +1,256 @@
 import tarfile
+import numpy as np
 import pandas as pd
 import os
 import io
 import shutil
 from datetime import datetime, timedelta
+import csv_schema
 
 UPLOAD_FOLDER = 'uploads'
 EXTRACT_FOLDER = 'extracted'
 
+# Candidate column names seen across the different grid exports
+CLIENT_COLUMNS = ['client_name', 'client', 'hostname']
+DATE_COLUMNS = ['completed_at', 'completed_date', 'completed_ts']
+EXPIRY_COLUMNS = ['expiry_date', 'expire_at', 'expiration_date']
+BYTE_COLUMNS = ['scanned_bytes', 'bytes_scanned']
+RETENTION_COLUMNS = ['retention_days', 'retention_string']
+
+# Column roles recorded per CSV header by the schema registry
+COLUMN_ROLES = {
+    'domain': ['domain'],
+    'client': CLIENT_COLUMNS,
+    'completed': DATE_COLUMNS,
+    'expiry': EXPIRY_COLUMNS,
+    'bytes': BYTE_COLUMNS,
+    'retention': RETENTION_COLUMNS
+}
+
+# Name each role's column gets at ingest, so files with different headers
+# line up in one column after the merge. Retention days and retention strings
+# hold different values and keep their own columns.
+CANONICAL_COLUMNS = {
+    'client': 'client_name',
+    'completed': 'completed_date',
+    'expiry': 'expiry_date',
+    'bytes': 'scanned_bytes'
+}
+
+# Reporting windows (days) for "active" clients and "expiring soon" backups
+ACTIVE_WINDOW_DAYS = 7
+EXPIRY_WINDOW_DAYS = 30
+# Upper bound for custom windows picked in the UI
+MAX_WINDOW_DAYS = 3650
+
+# Epoch seconds of the completed/expiry dates, parsed once at ingest
+# (add_epoch_columns). Internal helpers, not part of exported records.
+EPOCH_COLUMNS = ['completed_epoch', 'expiry_epoch']
+
+# Display order for the retention buckets
+BUCKET_ORDER = ['7 days', '30 days', '90 days', '1 year', '7 years']
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'gz', 'tar'}
 
-def extract_and_process_tar(filepath, extract_to, progress_callback=None):
+def find_column(df, candidates):
+    """Returns the first of the candidate column names present in df (or None)."""
+    return next((c for c in candidates if c in df.columns), None)
+
+def find_grid_column(df):
+    # Grid column name varies in case between exports
+    for col in df.columns:
+        if col.lower() == 'grid':
+            return col
+    return None
+
+def retention_bucket(val):
+    """Maps a retention value ("30", "30 days", 365...) to a display bucket."""
+    try:
+         # Handle strings like "30 days" or "30"
+         s = str(val).lower().replace('days','').replace('day','').replace('years','').replace('year','').strip()
+         d = float(s)
+         if d <= 9: return "7 days"
+         if d <= 35: return "30 days"
+         if d <= 100: return "90 days"
+         if d <= 400: return "1 year"
+         return "7 years"
+    except:
+         # If conversion fails, return the string itself (or mapped if needed)
+         return str(val) if val else "Unknown"
+
+def bucket_series(series):
+    # Retention columns only hold a handful of distinct values, so bucket those
+    # once and map them back instead of calling retention_bucket per row.
+    mapping = {val: retention_bucket(val) for val in series.dropna().unique()}
+    return series.map(mapping).fillna('Unknown')
+
+def sort_buckets(keys):
+    # Map known keys to index, unknown keys get 999
+    order_map = {k: i for i, k in enumerate(BUCKET_ORDER)}
+    return sorted(keys, key=lambda k: order_map.get(k, 999))
+
+def to_epoch_series(series):
+    """
+    Converts a date column to float epoch seconds (NaN where unparseable).
+    Numeric columns are assumed to already be epoch seconds.
+    """
+    try:
+        return pd.to_numeric(series, errors='raise').astype('float64')
+    except (ValueError, TypeError):
+        dt_series = pd.to_datetime(series, errors='coerce')
+        if getattr(dt_series.dt, 'tz', None) is not None:
+            dt_series = dt_series.dt.tz_convert(None)
+        return (dt_series - pd.Timestamp('1970-01-01')) / pd.Timedelta(seconds=1)
+
+def add_epoch_columns(df):
+    """Adds completed_epoch/expiry_epoch (float seconds, NaN if unknown) to df in place."""
+    date_col = find_column(df, DATE_COLUMNS)
+    expiry_col = find_column(df, EXPIRY_COLUMNS)
+    df['completed_epoch'] = to_epoch_series(df[date_col]).values if date_col else np.nan
+    df['expiry_epoch'] = to_epoch_series(df[expiry_col]).values if expiry_col else np.nan
+    return df
+
+def get_reference_date(df):
+    """
+    Determines the reference "Today" for a dataset.
+    Defaults to the current time, but stale datasets (max completed_date older
+    than yesterday) are reported as of their own max date.
+    Returns (today, is_override).
+    """
+    today = datetime.now()
+    is_override = False
+
+    if df is not None and 'completed_date' in df.columns:
+        try:
+            if 'completed_epoch' in df.columns and find_column(df, DATE_COLUMNS) == 'completed_date':
+                # Already parsed at ingest
+                max_epoch = df['completed_epoch'].max()
+                max_date_ts = pd.to_datetime(max_epoch, unit='s') if pd.notnull(max_epoch) else pd.NaT
+            else:
+                max_date_ts = pd.to_datetime(df['completed_date'], errors='coerce').max()
+            if pd.notnull(max_date_ts):
+                max_date = max_date_ts.to_pydatetime()
+                if max_date < (datetime.now() - timedelta(days=1)):
+                    today = max_date
+                    is_override = True
+        except Exception as e:
+            print(f"Error determining max date: {e}")
+
+    return today, is_override
+
+def parse_domain(val):
+    """
+    Splits a domain into (customer, is_replica, source_grid).
+    Standard format: /Customer/Client
+    Replication format: /REPLICATE/SourceGrid/Customer/Client
+    """
+    if pd.isna(val):
+        return 'Unknown', False, ''
+
+    # Split by / and remove empty strings
+    parts = [p for p in str(val).split('/') if p]
+    if not parts:
+        return 'Unknown', False, ''
+
+    if parts[0].upper() == 'REPLICATE':
+        if len(parts) >= 3:
+            return parts[2], True, parts[1]
+        if len(parts) >= 2:
+            return parts[1], True, ''
+        return parts[0], True, ''
+    return parts[0], False, ''
+
+def _key_codes(*series):
+    """Factorizes several series into one shared integer code space."""
+    codes, _ = pd.factorize(pd.concat([s.astype(str) for s in series], ignore_index=True))
+    out, start = [], 0
+    for s in series:
+        out.append(codes[start:start + len(s)])
+        start += len(s)
+    return out
+
+def match_replicas(df):
+    """
+    Joins each replicated backup to the primary backup it was copied from.
+
+    A replica on grid B with domain /REPLICATE/A/Customer/... matches the
+    primary row on grid A with the same customer, client and completed time.
+    Keys are factorized to integers and joined with a pandas merge (hash
+    join), so this stays vectorized for very large datasets.
+
+    Adds two boolean columns in place:
+      replica_matched - replica row whose primary copy is in the dataset
+      has_replica     - primary row that has at least one replica
+    """
+    df['replica_matched'] = False
+    df['has_replica'] = False
+
+    grid_col = find_grid_column(df)
+    client_col = find_column(df, CLIENT_COLUMNS)
+    if df.empty or grid_col is None or client_col is None or 'is_replica' not in df.columns:
+        return df
+
+    is_replica = df['is_replica'].values.astype(bool)
+    if not is_replica.any():
+        return df
+
+    grid_codes, source_codes = _key_codes(df[grid_col], df['replica_source_grid'])
+    keys = pd.DataFrame({
+        'grid': np.where(is_replica, source_codes, grid_codes),
+        'customer': pd.factorize(df['extracted_customer'])[0],
+        'client': pd.factorize(df[client_col])[0],
+    })
+    date_col = find_column(df, DATE_COLUMNS)
+    if date_col:
+        # Replicas keep the source backup's completion time
+        completed = df['completed_epoch'] if 'completed_epoch' in df.columns else to_epoch_series(df[date_col])
+        keys['completed'] = completed.fillna(-1).round().astype('int64').values
+    on = list(keys.columns)
+    keys['pos'] = np.arange(len(df))
+
+    primaries = keys[~is_replica]
+    replicas = keys[is_replica]
+
+    hits = replicas.merge(primaries[on].drop_duplicates(), on=on, how='inner')['pos'].values
+    sources = primaries.merge(replicas[on].drop_duplicates(), on=on, how='inner')['pos'].values
+
+    matched = np.zeros(len(df), dtype=bool)
+    matched[hits] = True
+    df['replica_matched'] = matched
+    replicated = np.zeros(len(df), dtype=bool)
+    replicated[sources] = True
+    df['has_replica'] = replicated
+    return df
+
+def replica_capacity(df, byte_col, by):
+    """
+    Primary vs replica bytes grouped by the `by` column.
+    unique_bytes counts primaries plus replicas whose source is not in the
+    dataset, i.e. the data without double-counted copies.
+    """
+    scanned = pd.to_numeric(df[byte_col], errors='coerce').fillna(0).values
+    is_replica = df['is_replica'].values.astype(bool) if 'is_replica' in df.columns else np.zeros(len(df), dtype=bool)
+    matched = df['replica_matched'].values.astype(bool) if 'replica_matched' in df.columns else np.zeros(len(df), dtype=bool)
+
+    frame = pd.DataFrame({
+        'key': df[by].fillna('Unknown').values,
+        'primary_bytes': np.where(is_replica, 0, scanned),
+        'replica_bytes': np.where(is_replica, scanned, 0),
+        'matched_bytes': np.where(is_replica & matched, scanned, 0),
+        'orphan_bytes': np.where(is_replica & ~matched, scanned, 0),
+    })
+    grouped = frame.groupby('key', sort=True).sum()
+    grouped['unique_bytes'] = grouped['primary_bytes'] + grouped['orphan_bytes']
+    return grouped
+
+def extract_and_process_tar(filepath, extract_to, progress_callback=None, schema_file=None):
     """
     Extracts a tar.gz file matches 'grids' directory, filters old data,
     and returns a list of dataframes or summary data.
+    CSV dtypes come from the header schema registry at schema_file (learned
+    for this archive only if not given), see csv_schema.
     """
     def report_progress(message, percent):
         if progress_callback:
@@ -60,6 +295,8 @@ def extract_and_process_tar(filepath, extract_to, progress_callback=None):
     
     total_files = len(csv_files)
     report_progress(f"Found {total_files} CSV reports to process.", 20)
+
+    schemas = csv_schema.SchemaRegistry(schema_file, roles=COLUMN_ROLES)
     
     for i, full_path in enumerate(csv_files):
         filename = os.path.basename(full_path)
@@ -69,64 +306,51 @@ def extract_and_process_tar(filepath, extract_to, progress_callback=None):
         report_progress(f"Processing {filename}", current_percent)
 
         try:
-            df = pd.read_csv(full_path)
+            # Fixed dtypes for known headers instead of per-file inference
+            df, schema = schemas.read_csv(full_path)
             df['source_file'] = filename
+
+            # Role columns under one name for every header (see CANONICAL_COLUMNS)
+            renames = {col: CANONICAL_COLUMNS[role] for role, col in schema['columns'].items()
+                       if role in CANONICAL_COLUMNS and col != CANONICAL_COLUMNS[role]
+                       and CANONICAL_COLUMNS[role] not in df.columns}
+            if renames:
+                df = df.rename(columns=renames)
             
             # Logic to extract Customer from Domain
             # "Customer: This is name of the source file (user said this, but likely means Avamar Grid), 
             #  and it is the first section of the domain column."
             
             # We will prioritize the Domain column extraction
-            customer_col = None
-            for col in df.columns:
-                if col.lower() == 'domain':
-                    customer_col = col
-                    break
+            customer_col = schema['columns'].get('domain')
             
             if customer_col:
                 # Logic to extract Customer from Domain
                 # Standard format: /Customer/Client
                 # Replication format: /REPLICATE/SourceGrid/Customer/Client
                 
-                # Optimized list comprehension instead of .apply() which is slow
-                customers = []
-                replicas = []
-                
-                for val in df[customer_col]:
-                    is_replica = False
-                    customer = 'Unknown'
-                    
-                    if not pd.isna(val):
-                        # Split by / and remove empty strings
-                        parts = [p for p in str(val).split('/') if p]
-                        
-                        if parts:
-                            # Check for REPLICATE prefix
-                            if parts[0].upper() == 'REPLICATE':
-                                is_replica = True
-                                # Usually /REPLICATE/Grid/Customer/...
-                                if len(parts) >= 3:
-                                    customer = parts[2]
-                                elif len(parts) >= 2:
-                                    customer = parts[1]
-                                else:
-                                    customer = parts[0]
-                            else:
-                                customer = parts[0]
-                    
-                    customers.append(customer)
-                    replicas.append(is_replica)
-
-                df['extracted_customer'] = customers
-                df['is_replica'] = replicas
+                # Domains repeat across many rows, so parse each distinct value
+                # once and map the results back through the factorized codes.
+                # Missing domains get code -1, which picks the trailing default.
+                codes, uniques = pd.factorize(df[customer_col])
+                parsed = [parse_domain(val) for val in uniques] + [('Unknown', False, '')]
+                df['extracted_customer'] = np.array([p[0] for p in parsed], dtype=object)[codes]
+                df['is_replica'] = np.array([p[1] for p in parsed], dtype=bool)[codes]
+                df['replica_source_grid'] = np.array([p[2] for p in parsed], dtype=object)[codes]
             else:
                 df['extracted_customer'] = 'Unknown'
                 df['is_replica'] = False
+                df['replica_source_grid'] = ''
 
             dfs.append(df)
         except Exception as e:
             print(f"Error reading {filename}: {e}")
 
+    try:
+        schemas.save()
+    except Exception as e:
+        print(f"Error saving CSV schema registry: {e}")
+
     if not dfs:
         return [], [], "No CSV files found in archive."
 
@@ -181,6 +405,10 @@ def extract_and_process_tar(filepath, extract_to, progress_callback=None):
     report_progress("Merging datasets...", 90)
     if dfs:
         master_df = pd.concat(dfs, ignore_index=True)
+        report_progress("Parsing backup dates...", 92)
+        add_epoch_columns(master_df)
+        report_progress("Matching replicas to primary backups...", 95)
+        match_replicas(master_df)
     else:
         master_df = pd.DataFrame()
 
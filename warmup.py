@@ -0,0 +1,61 @@
+"""
+Post-ingest report warm-up.
+
+After an archive is loaded, the stats for every grid and customer report are
+computed in the background on a small thread pool, so the first visitor to
+each report is served from the cache instead of waiting for
+get_dashboard_stats. The dataset is already live while this runs; reports
+that are not warm yet are simply computed on demand as before.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import find_grid_column
+
+ORDERS = ('largest', 'name')
+
+def warmup_targets(df, order='largest'):
+    """
+    Lists the reports to warm as ('grid' | 'customer', name) tuples.
+    'largest' computes the reports with the most backups first, 'name' goes
+    alphabetically (grids before customers).
+    """
+    counts = []
+    grid_col = find_grid_column(df)
+    if grid_col:
+        counts += [('grid', name, n) for name, n in df[grid_col].value_counts().items()]
+    if 'extracted_customer' in df.columns:
+        counts += [('customer', name, n) for name, n in df['extracted_customer'].value_counts().items()]
+
+    if order == 'name':
+        counts.sort(key=lambda t: (t[0] != 'grid', str(t[1])))
+    else:
+        counts.sort(key=lambda t: t[2], reverse=True)
+    return [(kind, name) for kind, name, _ in counts]
+
+def run(targets, compute, workers=2, progress=None, is_current=None):
+    """
+    Calls compute(kind, name) for every target on a pool of workers.
+    progress(done, total) is reported as reports finish; is_current() is
+    checked before each report so a warm-up for a dataset that has since
+    been replaced stops early. Returns the number of reports computed.
+    """
+    total = len(targets)
+    done = 0
+
+    def task(kind, name):
+        if is_current is not None and not is_current():
+            return False
+        compute(kind, name)
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(task, kind, name) for kind, name in targets]
+        for future in as_completed(futures):
+            try:
+                if future.result():
+                    done += 1
+            except Exception as e:
+                print(f"Warm-up report failed: {e}")
+            if progress:
+                progress(done, total)
+    return done
@@ -0,0 +1,158 @@
+"""
+Input-directory watcher.
+
+Polls the configured input_directory for archives. A new file is considered
+complete once its size and mtime have stopped changing for a full poll, and
+is then pre-ingested into the processed-dataset cache in the background,
+but only inside the configured off-hours window. Each archive version is
+pre-ingested once: one the cache has since pruned is not queued again.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar')
+
+def parse_window(window):
+    """Parses "HH:MM-HH:MM" into (start, end) times. Empty means no window (None)."""
+    if not window:
+        return None
+    start_s, end_s = [p.strip() for p in window.split('-', 1)]
+    return datetime.strptime(start_s, '%H:%M').time(), datetime.strptime(end_s, '%H:%M').time()
+
+def in_window(window, now=None):
+    """
+    True if now falls inside window ("HH:MM-HH:MM", may wrap past midnight).
+    An empty window means any time.
+    """
+    try:
+        bounds = parse_window(window)
+    except ValueError:
+        print(f"Invalid pre-ingest window '{window}', expected HH:MM-HH:MM")
+        return False
+    if bounds is None:
+        return True
+
+    start, end = bounds
+    current = (now or datetime.now()).time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+class InputWatcher:
+    def __init__(self, load_config, is_warm, ingest, interval=60):
+        # load_config() -> config dict, is_warm(path) -> bool, ingest(path) -> error or None
+        self.load_config = load_config
+        self.is_warm = is_warm
+        self.ingest = ingest
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.directory = None
+        self.files = []
+        self.status = {}     # filename -> 'settling' | 'queued' | 'ingesting' | 'warm' | 'evicted' | 'failed'
+        self._seen = {}      # filename -> (size, mtime) from the previous poll
+        self._ingested = {}  # filename -> (size, mtime) pre-ingested successfully
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='input-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def listing(self, directory):
+        """Returns (files, status) from the last scan if it covered directory, else None."""
+        with self.lock:
+            if self.directory != directory:
+                return None
+            return list(self.files), dict(self.status)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"Input watcher error: {e}")
+            self._stop.wait(self.interval)
+
+    def scan(self):
+        config = self.load_config()
+        directory = config.get('input_directory')
+        if not directory or not os.path.isdir(directory):
+            with self.lock:
+                self.directory, self.files, self.status, self._seen, self._ingested = directory, [], {}, {}, {}
+            return
+
+        current = {}
+        for f in os.listdir(directory):
+            if not f.lower().endswith(ARCHIVE_SUFFIXES):
+                continue
+            try:
+                st = os.stat(os.path.join(directory, f))
+            except OSError:
+                continue
+            current[f] = (st.st_size, st.st_mtime)
+
+        with self.lock:
+            if self.directory != directory:
+                self._seen, self.status, self._ingested = {}, {}, {}
+            previous = self._seen
+            self.directory = directory
+            self.files = sorted(current)
+            self._seen = current
+
+            ready = []
+            for f, sig in current.items():
+                path = os.path.join(directory, f)
+                if self.status.get(f) in ('ingesting', 'failed') and previous.get(f) == sig:
+                    continue
+                if self.is_warm(path):
+                    self.status[f] = 'warm'
+                elif self._ingested.get(f) == sig:
+                    # Pruned from the cache (LRU) since, re-ingesting would evict another
+                    self.status[f] = 'evicted'
+                elif previous.get(f) != sig:
+                    # New or still being written, check again next poll
+                    self.status[f] = 'settling'
+                else:
+                    self.status[f] = 'queued'
+                    ready.append(f)
+            for f in list(self.status):
+                if f not in current:
+                    del self.status[f]
+            for f in list(self._ingested):
+                if self._ingested[f] != current.get(f):
+                    del self._ingested[f]
+
+        if not config.get('preingest_enabled', True) or not in_window(config.get('preingest_window', '')):
+            return
+
+        # One archive at a time keeps the service responsive
+        for f in ready:
+            if self._stop.is_set() or not in_window(config.get('preingest_window', '')):
+                break
+            path = os.path.join(directory, f)
+            with self.lock:
+                self.status[f] = 'ingesting'
+            print(f"Pre-ingesting {path}")
+            started = time.time()
+            try:
+                error = self.ingest(path)
+            except Exception as e:
+                error = str(e)
+            with self.lock:
+                self.status[f] = 'failed' if error else 'warm'
+                if not error:
+                    self._ingested[f] = current[f]
+            if error:
+                print(f"Pre-ingest of {path} failed: {error}")
+            else:
+                print(f"Pre-ingested {path} in {time.time() - started:.1f}s")